@@ -6,6 +6,7 @@ with this bout information.
 A bout is a time range within a larger set of data that shares a particular feature.
 """
 
+import numpy as np
 import pandas as pd
 
 
@@ -14,7 +15,8 @@ def extract_bouts(
 ):
     """
     Extract from a Pandas DataFrame a list of bouts, where each bout is indicated by a minimum and maximum
-    timestamp range and determined by valid ranges.
+    timestamp range and determined by valid ranges. The DataFrame is not modified, so bouts can safely be
+    extracted from multiple threads.
 
     Parameters
     ----------
@@ -47,26 +49,49 @@ def extract_bouts(
             Name: valid, dtype: bool
                 Whether the bout is valid according to given criterium
     """
-    df["_filter"] = valid.loc[df.index]
-
-    dfBool = valid != valid.shift()
-    dfCumsum = dfBool.cumsum()
-
-    by_list = [dfCumsum]
+    # run-length encoding of the valid values, missing values each being a run of their own
+    values = valid.values
+    missing = pd.isna(values)
+    change = np.ones(len(values), dtype=bool)
+    change[1:] = (values[1:] != values[:-1]) | missing[1:] | missing[:-1]
+    codes = np.cumsum(change) - 1
+    if not valid.index.equals(df.index):
+        codes = pd.Series(codes, index=valid.index).loc[df.index].values
+        codes = pd.factorize(codes)[0]
+        values = valid.loc[df.index].values
+
+    # bouts are split at the group boundaries as well, numbered in order of appearance like an unsorted groupby
     for b in by:
-        by_list.append(b)
-
-    groups = df.groupby(by=by_list, sort=False)
-
-    bouts = groups.agg({range_column: ["count", "min", "max"], "_filter": ["first"]})
-    bouts.columns = [
-        "count",
-        range_column + "_start",
-        range_column + "_end",
-        valid_column,
-    ]
-
-    df.drop(columns=["_filter"], inplace=True)
+        group_codes, groups = pd.factorize(df[b])
+        grouped = (codes >= 0) & (group_codes >= 0)
+        codes = np.where(grouped, codes * len(groups) + group_codes, -1)
+        codes[grouped] = _number_by_appearance(codes[grouped])
+
+    bout_codes, first_rows = np.unique(codes, return_index=True)
+    first_rows = first_rows[bout_codes >= 0]
+    n_bouts = len(first_rows)
+
+    # first and last timestamp per bout, by sorting the rows on bout and timestamp
+    t = df[range_column]
+    rows = np.flatnonzero((codes >= 0) & ~pd.isna(t).values)
+    rows = rows[np.lexsort((t.values[rows], codes[rows]))]
+    is_first = np.ones(len(rows), dtype=bool)
+    is_first[1:] = codes[rows[1:]] != codes[rows[:-1]]
+    is_last = np.ones(len(rows), dtype=bool)
+    is_last[:-1] = is_first[1:]
+
+    firsts, lasts = rows[is_first], rows[is_last]
+    t_start = t.iloc[firsts].set_axis(codes[firsts]).reindex(range(n_bouts))
+    t_end = t.iloc[lasts].set_axis(codes[lasts]).reindex(range(n_bouts))
+
+    bouts = pd.DataFrame(
+        {
+            "count": np.bincount(codes[rows], minlength=n_bouts),
+            range_column + "_start": t_start.values,
+            range_column + "_end": t_end.values,
+            valid_column: values[first_rows],
+        }
+    )
 
     if not keep_invalid:
         bouts = bouts[bouts[valid_column]]
@@ -76,6 +101,421 @@ def extract_bouts(
     return bouts
 
 
+def _number_by_appearance(keys):
+    """Number integer keys 0, 1, ... in order of first appearance."""
+    if len(keys) == 0:
+        return keys
+
+    change = keys[1:] != keys[:-1]
+    if np.all(keys[1:][change] > keys[:-1][change]):
+        # increasing keys, so every change is a new key
+        return np.concatenate([[0], np.cumsum(change)])
+
+    return pd.factorize(keys)[0]
+
+
+def _as_ns(t):
+    """
+    Convert timestamps (a scalar, array or Series of datetimes, or int64 [ns]) to int64 [ns] values.
+
+    Returns
+    -------
+    numpy.ndarray
+        The int64 [ns] timestamps
+    numpy.ndarray
+        Whether the timestamps are missing (NaT)
+    """
+    t = np.asarray(t).ravel()
+    if t.dtype.kind not in "iu":
+        t = pd.to_datetime(pd.Series(t)).values
+    missing = pd.isna(t)
+    if t.dtype.kind == "M":
+        t = t.astype("datetime64[ns]").view("int64")
+
+    return t.astype("int64"), missing
+
+
+class BoutIndex:
+    """
+    Index of a set of bouts for fast lookups, built from the output of `extract_bouts`.
+
+    The bout boundaries are held as sorted int64 [ns] timestamps that split the time axis into segments, each
+    segment being covered by at most one owning bout. When bouts overlap the later bout owns the segment.
+    Following `add_bouts_as_column` a bout contains the timestamps start <= t < end.
+
+    Parameters
+    ----------
+    starts, ends : numpy.ndarray
+        Start and end timestamps of the bouts (datetime64 or int64 [ns]), NaT for bouts that contain nothing
+    valid : numpy.ndarray
+        Optional bool array with the validness of the bouts, defaults to all valid
+    """
+
+    def __init__(self, starts, ends, valid=None):
+        self.starts, missing_starts = _as_ns(starts)
+        self.ends, missing_ends = _as_ns(ends)
+        self.valid = (
+            np.ones(len(self.starts), dtype=bool)
+            if valid is None
+            else np.asarray(valid, dtype=bool)
+        )
+
+        # bouts that contain at least a single timestamp
+        self._missing = missing_starts | missing_ends
+        self._filled = np.flatnonzero(~self._missing & (self.ends > self.starts))
+        self.edges = np.unique(
+            np.concatenate([self.starts[self._filled], self.ends[self._filled]])
+        )
+
+        lo = np.searchsorted(self.edges, self.starts[self._filled])
+        hi = np.searchsorted(self.edges, self.ends[self._filled])
+        self._owners = np.full(max(len(self.edges) - 1, 0), -1, dtype="int64")
+
+        if np.all(lo[1:] >= hi[:-1]):
+            # ordered bouts without overlap: each segment has at most one bout, label all at once
+            segments = np.arange(len(self._owners))
+            candidate = np.searchsorted(lo, segments, side="right") - 1
+            inside = candidate >= 0
+            inside[inside] = segments[inside] < hi[candidate[inside]]
+            self._owners[inside] = self._filled[candidate[inside]]
+        else:
+            # overlapping bouts, the last bout wins
+            for idx in range(len(self._filled)):
+                self._owners[lo[idx] : hi[idx]] = self._filled[idx]
+
+    @classmethod
+    def from_bouts(
+        cls, bouts, range_column="t", valid_column="valid", valid_only=False
+    ):
+        """
+        Create an index from a bouts DataFrame.
+
+        Parameters
+        ----------
+        bouts : pandas.Dataframe
+            The DataFrame containing the bouts, created with `extract_bouts`
+        range_column : str
+            Optional string indicating the column in original for the timestamp. This results in a prefix
+            in the bouts DataFrame, timestamp column 't' leads to bout columns 't_start' and 't_end'.
+        valid_column : str
+            Optional column with the validness of the bouts, all bouts are valid if it does not exist
+        valid_only : bool
+            Optional whether to only index the valid bouts
+
+        Returns
+        -------
+        BoutIndex
+            The index, bout k of the index being row k of the (valid) bouts
+        """
+        if valid_only and valid_column in bouts:
+            bouts = bouts[bouts[valid_column].values.astype(bool)]
+
+        return cls(
+            bouts[range_column + "_start"].values,
+            bouts[range_column + "_end"].values,
+            valid=bouts[valid_column].values if valid_column in bouts else None,
+        )
+
+    def __len__(self):
+        return len(self.starts)
+
+    def to_bouts(self, range_column="t", valid_column="valid"):
+        """
+        Convert the index back to a bouts DataFrame.
+
+        Parameters
+        ----------
+        range_column : str
+            Optional prefix of the timestamp columns, 't' leads to bout columns 't_start' and 't_end'
+        valid_column : str
+            Optional string indicating the name in the output DataFrame indicating the validness of the bout
+
+        Returns
+        -------
+        pandas.DataFrame
+            Columns:
+                Name: t_start, dtype: datetime64[ns]
+                    Starting timestamp of the bout (t_ prefix depends on range_column)
+                Name: t_end, dtype: datetime64[ns]
+                    End timestamp of the bout (t_ prefix depends on range_column)
+                Name: valid, dtype: bool
+                    Whether the bout is valid
+        """
+        return pd.DataFrame(
+            {
+                range_column + "_start": self.starts.view("datetime64[ns]"),
+                range_column + "_end": self.ends.view("datetime64[ns]"),
+                valid_column: self.valid,
+            }
+        )
+
+    def find(self, t):
+        """
+        Find the bouts containing timestamps by binary search.
+
+        Parameters
+        ----------
+        t : pandas.Timestamp/pandas.Series/numpy.ndarray
+            The timestamp(s) to look up (datetime or int64 [ns])
+
+        Returns
+        -------
+        int/numpy.ndarray
+            Position of the bout containing each timestamp, or -1 if there is none
+        """
+        values, missing = _as_ns(t)
+
+        segment = np.searchsorted(self.edges, values, side="right") - 1
+        inside = ~missing & (segment >= 0) & (segment < len(self._owners))
+
+        found = np.full(len(values), -1, dtype="int64")
+        found[inside] = self._owners[segment[inside]]
+
+        return int(found[0]) if np.ndim(t) == 0 else found
+
+    def covers(self, t):
+        """
+        Whether timestamps lie within a valid bout, e.g. to apply a combined filter to the data at once.
+
+        Parameters
+        ----------
+        t : pandas.Timestamp/pandas.Series/numpy.ndarray
+            The timestamp(s) to look up (datetime or int64 [ns])
+
+        Returns
+        -------
+        bool/numpy.ndarray
+            Whether each timestamp is contained by a valid bout
+        """
+        found = np.atleast_1d(self.find(t))
+        covered = np.zeros(len(found), dtype="bool")
+        hit = found >= 0
+        covered[hit] = self.valid[found[hit]]
+
+        return bool(covered[0]) if np.ndim(t) == 0 else covered
+
+    def slices(self, t, include_end=False):
+        """
+        Find the rows of every bout in a time-sorted column by binary search.
+
+        Parameters
+        ----------
+        t : pandas.Series/numpy.ndarray
+            The timestamps sorted in ascending order, e.g. the 't' column of a sorted DataFrame
+        include_end : bool
+            Optional whether to include rows at the end timestamp of the bouts
+
+        Returns
+        -------
+        numpy.ndarray
+            Position of the first row of each bout
+        numpy.ndarray
+            Position after the last row of each bout, use `df.iloc[start:end]` to get the rows
+        """
+        values, _ = _as_ns(t)
+
+        start = np.searchsorted(values, self.starts, side="left")
+        end = np.searchsorted(
+            values, self.ends, side="right" if include_end else "left"
+        )
+
+        start[self._missing] = 0
+        end[self._missing] = 0
+
+        return start, np.maximum(start, end)
+
+    def padded(self, window=[0, 0]):
+        """
+        Pad the bouts with a time window, like `with_padded_bout_window`.
+
+        Parameters
+        ----------
+        window : list
+            The number of seconds to add to the starting and end time of the bouts
+
+        Returns
+        -------
+        BoutIndex
+            A new index with the padded bouts
+        """
+        return BoutIndex(
+            self.starts.view("datetime64[ns]") + pd.to_timedelta(window[0], unit="s"),
+            self.ends.view("datetime64[ns]") + pd.to_timedelta(window[1], unit="s"),
+            valid=self.valid,
+        )
+
+    def _combine(self, other, operation):
+        """Set operation on the time covered by the valid bouts of both indexes."""
+        edges = np.union1d(self.edges, other.edges)
+        keep = operation(self.covers(edges[:-1]), other.covers(edges[:-1]))
+
+        change = np.diff(np.concatenate([[0], keep.astype("int8"), [0]]))
+        return BoutIndex(
+            edges[np.flatnonzero(change == 1)], edges[np.flatnonzero(change == -1)]
+        )
+
+    def union(self, other):
+        """
+        The time covered by the valid bouts in this or the other index.
+
+        Parameters
+        ----------
+        other : BoutIndex
+            The other set of bouts
+
+        Returns
+        -------
+        BoutIndex
+            A new index with ordered, non-overlapping (valid) bouts
+        """
+        return self._combine(other, np.logical_or)
+
+    def intersection(self, other):
+        """
+        The time covered by the valid bouts in both this and the other index.
+
+        Parameters
+        ----------
+        other : BoutIndex
+            The other set of bouts
+
+        Returns
+        -------
+        BoutIndex
+            A new index with ordered, non-overlapping (valid) bouts
+        """
+        return self._combine(other, np.logical_and)
+
+    def difference(self, other):
+        """
+        The time covered by the valid bouts in this index, but not by the valid bouts in the other index.
+
+        Parameters
+        ----------
+        other : BoutIndex
+            The other set of bouts
+
+        Returns
+        -------
+        BoutIndex
+            A new index with ordered, non-overlapping (valid) bouts
+        """
+        return self._combine(other, lambda a, b: a & ~b)
+
+    def pruned(self, min_duration=0):
+        """
+        Remove the bouts that are shorter than a minimum duration.
+
+        Parameters
+        ----------
+        min_duration : float
+            The minimum duration in seconds of the bouts to keep
+
+        Returns
+        -------
+        BoutIndex
+            A new index with only the bouts that last at least min_duration
+        """
+        keep = ~self._missing & (
+            self.ends - self.starts >= pd.to_timedelta(min_duration, unit="s").value
+        )
+
+        return BoutIndex(self.starts[keep], self.ends[keep], valid=self.valid[keep])
+
+
+def _bout_owners(df, bouts, range_column="t"):
+    """
+    Find for every row in a DataFrame the bout (created with `extract_bouts`) that contains it,
+    using binary search on the bout boundaries instead of a mask per bout.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The DataFrame containing the rows to look up
+    bouts : pandas.Dataframe
+        The DataFrame containing the bouts
+    range_column : str
+        Optional string indicating the column in df for the timestamp
+
+    Returns
+    -------
+    numpy.ndarray
+        For every row of df the position of the last bout with start <= row < end, or -1 if there is none
+    """
+    index = BoutIndex(
+        bouts[range_column + "_start"].values, bouts[range_column + "_end"].values
+    )
+
+    return index.find(df[range_column].values)
+
+
+def _interpolate_linear(x_new, x, y, keys_new=None, keys=None, unit=None):
+    """
+    Piecewise linear interpolation with linear extrapolation outside of the data range, evaluated for all
+    values at once. It gives the same values as `scipy.interpolate.interp1d(x, y, fill_value="extrapolate")`.
+
+    Parameters
+    ----------
+    x_new : numpy.ndarray
+        The values to evaluate the interpolation at
+    x : numpy.ndarray
+        The data points, does not need to be sorted
+    y : numpy.ndarray
+        The data values corresponding to x
+    keys_new : numpy.ndarray
+        Optional group key per value in x_new, each value is then only interpolated with the data points
+        that have the same key
+    keys : numpy.ndarray
+        Optional group key per data point, required when keys_new is given
+    unit : float
+        Optional change in x corresponding to a unit change in y, used to extrapolate groups with a single
+        data point. Such groups result in NaN when not given.
+
+    Returns
+    -------
+    numpy.ndarray
+        The interpolated values at x_new
+    """
+    if keys is None:
+        keys = np.zeros(len(x), dtype="int64")
+        keys_new = np.zeros(len(x_new), dtype="int64")
+    else:
+        codes = pd.factorize(np.concatenate([keys, keys_new]))[0]
+        keys, keys_new = codes[: len(x)], codes[len(x) :]
+
+    # data points sorted per group, keeping the order of equal points like interp1d does
+    order = np.lexsort((x, keys))
+    x, y, keys = x[order], y[order], keys[order]
+    first = np.searchsorted(keys, keys_new, side="left")
+    last = np.searchsorted(keys, keys_new, side="right")
+
+    # the number of data points in the same group below each new value, found by sorting the new values
+    # in between the data points and counting the data points in front of them
+    is_point = np.concatenate(
+        [np.ones(len(x), dtype=bool), np.zeros(len(x_new), dtype=bool)]
+    )
+    merged = np.lexsort(
+        (is_point, np.concatenate([x, x_new]), np.concatenate([keys, keys_new]))
+    )
+    is_point = is_point[merged]
+    below = np.empty(len(x_new), dtype="int64")
+    below[merged[~is_point] - len(x)] = (np.cumsum(is_point) - is_point)[~is_point]
+
+    y_new = np.full(len(x_new), np.nan)
+
+    multi = last - first > 1
+    hi = np.clip(below[multi], first[multi] + 1, last[multi] - 1)
+    lo = hi - 1
+    slope = (y[hi] - y[lo]) / (x[hi] - x[lo])
+    y_new[multi] = slope * (x_new[multi] - x[lo]) + y[lo]
+
+    single = last - first == 1
+    if unit is not None:
+        y_new[single] = y[first[single]] + (x_new[single] - x[first[single]]) / unit
+
+    return y_new
+
+
 def with_padded_bout_window(bouts, window=[0, 0], range_column="t"):
     """
     Pad the values in a Pandas DataFrame created with `extract_bouts` with a time window.
@@ -146,18 +586,24 @@ def add_bouts_as_column(
     if new_column not in df:
         df[new_column] = reset_value
 
-    for idx, bout in bouts.iterrows():
-        df.loc[
-            (df[range_column] >= bout[range_column + "_start"])
-            & (df[range_column] < bout[range_column + "_end"]),
-            new_column,
-        ] = (
-            bout[valid_column]
-            if value == "column"
-            else idx
-            if value == "index"
-            else value
-        )
+    owners = _bout_owners(df, bouts, range_column=range_column)
+    rows = owners >= 0
+
+    if len(bouts) > 0:
+        if value == "column":
+            values = bouts[valid_column].values[owners[rows]]
+        elif value == "index":
+            values = bouts.index.values[owners[rows]]
+        else:
+            values = value
+
+        if rows.all():
+            # assigning all rows would replace the column, set them into it instead to keep its (upcast) dtype
+            column = df[new_column].copy()
+            column.loc[rows] = values
+            df[new_column] = column
+        else:
+            df.loc[rows, new_column] = values
 
     return df
 
@@ -171,6 +617,7 @@ def interpolate_bouts_as_column(
     valid_column="valid",
     value_column="position",
     reset_value=pd.Series(dtype="float64"),
+    by=None,
 ):
     """
     Applies the time ranges in a bouts DataFrame created with `extract_bouts` to the rows in another DataFrame, by
@@ -195,6 +642,9 @@ def interpolate_bouts_as_column(
         Optional string indicating the name in the output DataFrame indicating the validness of the bout
     reset_value : object
         Optional default value set to the new bouts column if it does not yet exist
+    by : str
+        Optional column in both bouts and df_values, a row is then only interpolated with the values that have
+        the same key as the bout containing the row
 
     Returns
     -------
@@ -205,31 +655,29 @@ def interpolate_bouts_as_column(
     if new_column not in df:
         df[new_column] = reset_value
 
-    for idx, bout in bouts.iterrows():
-        bout_data = df[
-            (df[range_column] >= bout[range_column + "_start"])
-            & (df[range_column] < bout[range_column + "_end"])
-        ]
+    owners = _bout_owners(df, bouts, range_column=range_column)
+    rows = owners >= 0
+    if not rows.any() or len(df_values) == 0:
+        return df
 
-        t_data = pd.to_numeric(bout_data[range_column])
-        t_bout, val_bout = (
-            pd.to_numeric(df_values[range_column]),
-            df_values[value_column],
-        )
+    t_data = pd.to_numeric(df[range_column][rows]).values
+    t_bout = pd.to_numeric(df_values[range_column]).values
+    val_bout = df_values[value_column].values.astype("float64")
 
-        if len(t_bout) > 1:
-            from scipy import interpolate
+    if by is None:
+        keys_data, keys_bout = None, None
+    else:
+        keys_data = bouts[by].values[owners[rows]]
+        keys_bout = df_values[by].values
 
-            f = interpolate.interp1d(t_bout, val_bout, fill_value="extrapolate")
-            val_data = [f(t) for t in t_data]
-            df[new_column].iloc[bout_data.index] = val_data
-        else:
-            val_data = [
-                val_bout[0] + (t - t_bout) / 1e9 for t in t_data
-            ]  # manual extrapolation from a single point assuming ns precision in timestamps
-            df[new_column].iloc[bout_data.index] = val_data
+    # a single point is extrapolated assuming ns precision in timestamps
+    val_data = _interpolate_linear(
+        t_data, t_bout, val_bout, keys_new=keys_data, keys=keys_bout, unit=1e9
+    )
 
     # changes the df inplace but return dataframe for chaining purposes
+    df.loc[rows, new_column] = val_data
+
     return df
 
 
@@ -252,15 +700,72 @@ def select_range(df, window, range_column="t", include_end=True):
     Returns
     -------
     list(pandas.DataFrame)
-        A list of DataFrames selections
+        A list of DataFrames selections, views on the DataFrames when their range column is sorted
+    """
+    return select_ranges(
+        df, [window], range_column=range_column, include_end=include_end
+    )[0]
+
+
+def select_ranges(df, windows, range_column="t", include_end=True):
+    """
+    Select many ranges of data for multiple Pandas DataFrames at once, e.g. the data of every bout.
+    The ranges are found by binary search, so sorting the DataFrames on the range column up front pays off.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame/list
+        The (list of) DataFrame to use
+    windows : list/pandas.DataFrame
+        A list of 2-lists containing the minimum and maximum value of each range to select, or a DataFrame
+        with the ranges as bouts (created with `extract_bouts`)
+    range_column : str
+        Optional column in the DataFrame to use for the range (usually timestamp)
+    include_end : bool
+        Optional whether to include the max value in the range
+
+    Returns
+    -------
+    list(list(pandas.DataFrame))
+        For every window a list of DataFrames selections. When the range column of a DataFrame is sorted the
+        selections are positional slices, i.e. views on the DataFrame instead of copies.
     """
 
     if not isinstance(df, list):
         df = [df]
 
-    return [
-        dff[(dff[range_column] >= window[0]) & (dff[range_column] <= window[1])]
-        if include_end
-        else dff[(dff[range_column] >= window[0]) & (dff[range_column] < window[1])]
-        for dff in df
-    ]
+    if len(windows) == 0:
+        return []
+
+    if isinstance(windows, pd.DataFrame):
+        starts = windows[range_column + "_start"].reset_index(drop=True)
+        ends = windows[range_column + "_end"].reset_index(drop=True)
+    else:
+        starts = pd.Series([window[0] for window in windows])
+        ends = pd.Series([window[1] for window in windows])
+    missing = (pd.isna(starts) | pd.isna(ends)).values
+
+    selections = [[] for _ in range(len(starts))]
+    for dff in df:
+        values = dff[range_column]
+
+        if values.is_monotonic_increasing:
+            order = None
+        else:
+            # binary search on the sorted (non-missing) values, keeping the original order of the rows
+            order = np.flatnonzero(~pd.isna(values).values)
+            order = order[np.argsort(values.values[order], kind="mergesort")]
+            values = values.iloc[order]
+
+        lo = values.searchsorted(starts, side="left")
+        hi = values.searchsorted(ends, side="right" if include_end else "left")
+        lo[missing] = 0
+        hi = np.maximum(np.where(missing, 0, hi), lo)
+
+        for idx in range(len(starts)):
+            if order is None:
+                selections[idx].append(dff.iloc[lo[idx] : hi[idx]])
+            else:
+                selections[idx].append(dff.iloc[np.sort(order[lo[idx] : hi[idx]])])
+
+    return selections
@@ -8,6 +8,55 @@ import pandas as pd
 from mergait.bouts import *
 
 
+def get_activity_bouts(df_activity, activity="running", window=[10, -2]):
+    """
+    Get the bouts of time in which the phone detected an activity, such as 'walking', 'stationary' or 'running'.
+
+    Parameters
+    ----------
+    df_activity : pandas.Dataframe
+        The DataFrame containing the phone activity data
+    activity : str
+        The activity to select
+    window : list
+        A 2-list of a window of time in seconds to pad around the valid values to remove also start-up effects and
+        lags in recognizing the correct activity.
+
+    Returns
+    -------
+    BoutIndex
+        The (padded) bouts of the activity
+    """
+    valid = df_activity["activity"] == activity
+    bouts = extract_bouts(df_activity, valid, keep_invalid=False)
+
+    return BoutIndex.from_bouts(bouts).padded(window=window)
+
+
+def get_elevation_bouts(df_activity, window=[-10, 2]):
+    """
+    Get the bouts of time in which the floors in the activity data change, i.e. climbs instead of flat surfaces.
+
+    Parameters
+    ----------
+    df_activity : pandas.Dataframe
+        The DataFrame containing the phone activity data
+    window : list
+        A 2-list of a window of time in seconds to pad around the valid values to remove also start-up effects and
+        lags in recognizing the correct activity.
+
+    Returns
+    -------
+    BoutIndex
+        The (padded) bouts with a change in floors
+    """
+    floors = df_activity["floors_ascended"] + df_activity["floors_descended"]
+    valid = floors.diff() != 0
+    bouts = extract_bouts(df_activity, valid, keep_invalid=False)
+
+    return BoutIndex.from_bouts(bouts).padded(window=window)
+
+
 def append_activity_filter(
     df, df_activity, activity="running", window=[10, -2], new_column="bad_not_running"
 ):
@@ -34,15 +83,10 @@ def append_activity_filter(
     """
     df = df.copy()
 
-    valid = df_activity["activity"] == activity
-    bouts = extract_bouts(df_activity, valid, keep_invalid=False)
-    add_bouts_as_column(
-        df,
-        with_padded_bout_window(bouts, window=window),
-        new_column=new_column,
-        value=False,
-        reset_value=True,
-    )
+    covered = get_activity_bouts(df_activity, activity, window=window).covers(df["t"])
+    if new_column not in df:
+        df[new_column] = True
+    df.loc[covered, new_column] = False
 
     return df
 
@@ -73,16 +117,10 @@ def append_elevation_filter(
     """
     df = df.copy()
 
-    floors = df_activity["floors_ascended"] + df_activity["floors_descended"]
-    valid = floors.diff() != 0
-    bouts = extract_bouts(df_activity, valid, keep_invalid=False)
-    add_bouts_as_column(
-        df,
-        with_padded_bout_window(bouts, window=window),
-        new_column=new_column,
-        value=True,
-        reset_value=False,
-    )
+    covered = get_elevation_bouts(df_activity, window=window).covers(df["t"])
+    if new_column not in df:
+        df[new_column] = False
+    df.loc[covered, new_column] = True
 
     return df
 
@@ -122,7 +160,7 @@ def append_session_filters(
         df, df_sessions, new_column="session_id", valid_column="session_id"
     )
 
-    session_means = df.groupby("session_id").mean().reset_index()
+    session_means = df.groupby("session_id", observed=True).mean().reset_index()
 
     filter_frame = pd.DataFrame(
         data={
@@ -3,6 +3,7 @@
 
 import numpy as np
 import pandas as pd
+from functools import lru_cache
 from mergait.stats import *
 
 import logging
@@ -69,91 +70,374 @@ def gait_features_from_vertical_acceleration(
 
     from scipy.signal import find_peaks
 
+    timestamps = pd.Series(timestamps)
+    a_vert = np.asarray(a_vert)
+
     fc_peaks, _ = find_peaks(a_vert, prominence=1.5)
     ic_peaks, _ = find_peaks(-a_vert, prominence=1.5)
 
     log.debug("Finding initial and final contact peaks")
-    ic_times_ns = timestamps.iloc[ic_peaks]
-    fc_times_ns = timestamps.iloc[fc_peaks]
-    log.debug("Found {} IC and {} FC peaks".format(len(ic_times_ns), len(fc_times_ns)))
-
-    ic_times = pd.to_datetime(ic_times_ns)
-    fc_times = pd.to_datetime(fc_times_ns)
-
-    min_contact_time = pd.Timedelta(contact_time_range[0], "ms")
-    max_contact_time = pd.Timedelta(contact_time_range[1], "ms")
-    min_step_time = pd.Timedelta(step_time_range[0], "ms")
-    max_step_time = pd.Timedelta(step_time_range[1], "ms")
+    t_ic, t_fc = [
+        timestamps.values[peaks].astype("datetime64[ns]").view("int64")
+        for peaks in [ic_peaks, fc_peaks]
+    ]
+    log.debug("Found {} IC and {} FC peaks".format(len(ic_peaks), len(fc_peaks)))
 
-    ds_ic = pd.DataFrame(
-        {
-            "t": ic_times,
-            "t_contact_min": ic_times + min_contact_time,
-            "t_step_min": ic_times + min_step_time,
-            "t_ic": ic_times_ns,
-            "impact": -a_vert.iloc[ic_peaks],
-        }
-    ).reset_index(drop=True)
-    ds_fc = pd.DataFrame({"t": fc_times, "t_fc": fc_times_ns}).reset_index(drop=True)
+    ic_times = pd.to_datetime(timestamps.iloc[ic_peaks])
+    fc_times = pd.to_datetime(timestamps.iloc[fc_peaks])
 
     log.debug("Collecting contact pairs for feature extraction")
-    # collect intitial-final contact pair
-    df = pd.merge_asof(
-        ds_ic,
-        ds_fc,
-        left_on="t_contact_min",
-        right_on="t",
-        direction="forward",
-        suffixes=[None, "_fcm"],
-        tolerance=max_contact_time - min_contact_time,
+    steps, _ = _steps_from_contacts(
+        t_ic,
+        -a_vert[ic_peaks],
+        t_fc,
+        contact_time_range,
+        step_time_range,
     )
-    df["contact_time"] = (df["t_fc"] - df["t_ic"]) / 1e6
-    df.drop(["t_fc", "t_fcm"], axis=1, inplace=True)
-
-    # collect initial contact one foot and opposite foot
-    df = pd.merge_asof(
-        df,
-        ds_ic[["t", "t_ic"]],
-        left_on="t_step_min",
-        right_on="t",
-        suffixes=[None, "_opp"],
-        direction="forward",
-        tolerance=max_step_time - min_step_time,
-    )
-    df["step_duration"] = (df["t_ic_opp"] - df["t_ic"]) / 1e6
-    df["cadence"] = 60 / df["step_duration"]
-
-    # filter out invalid steps due to double ic/fc detections
-    df = df[
-        df["t"].shift(-1) - df["t"] > min_step_time
-    ]  # double ic's lead to invalid step times
-    df = df[
-        df["step_duration"] > df["contact_time"]
-    ]  # contact time cannot be longer than step time
-
-    df["stride_duration"] = pd.to_numeric(df["t"].shift(-2) - df["t"]) / 1e6
-    df = df[df["stride_duration"] > 0]  # stride duration must be positive
-    df = df[
-        df["t"].shift(-2) - df["t"] < 2 * max_step_time
-    ]  # also enforce maximum stride time
-
-    df["flight_ratio"] = (df["step_duration"] - df["contact_time"]) / df[
-        "step_duration"
-    ]
 
-    # drop extra columns and do clean up
-    df.drop(
-        ["t_contact_min", "t_step_min", "t_ic", "t_opp", "t_ic_opp"],
-        axis=1,
-        inplace=True,
+    df = pd.DataFrame(
+        {column: values for column, values in steps.items() if column != "ic"}
     )
-    df.reset_index(drop=True, inplace=True)
+    df["t"] = df["t"].values.view("datetime64[ns]")
 
     log.debug("] Done, returning {} gait cycles".format(len(df)))
 
     return df, ic_times, fc_times
 
 
+def _pair_forward(t_from, t_to, delay_range):
+    """
+    Find for every time in t_from the first time in t_to that is within a delay range after it.
+
+    Parameters
+    ----------
+    t_from, t_to : numpy.ndarray
+        Sorted int64 timestamps [ns]
+    delay_range : list
+        A 2-list with the minimum and maximum delay [ns]
+
+    Returns
+    -------
+    numpy.ndarray
+        Position in t_to of the paired time, -1 if there is none
+    """
+    t_min = t_from + delay_range[0]
+    pos = np.searchsorted(t_to, t_min, side="left")
+    found = pos < len(t_to)
+    found[found] = t_to[pos[found]] - t_min[found] <= delay_range[1] - delay_range[0]
+
+    return np.where(found, pos, -1)
+
+
+def _pair_durations(t_from, t_to, pos, as_float=None):
+    found = pos >= 0
+    if as_float is None:
+        # like the missing values of a merge, an unpaired time turns all timestamps into floats
+        as_float = not found.all()
+    if not as_float:
+        return (t_to[pos] - t_from) / 1e6
+
+    duration = np.full(len(pos), np.nan)
+    duration[found] = t_to[pos[found]].astype("float64") - t_from[found].astype(
+        "float64"
+    )
+    return duration / 1e6
+
+
+def _steps_from_contacts(
+    t_ic, impact, t_fc, contact_time_range, step_time_range, as_float=None
+):
+    """
+    Pair initial and final contacts into steps and apply the step constraints of
+    `gait_features_from_vertical_acceleration`.
+
+    Parameters
+    ----------
+    t_ic, t_fc : numpy.ndarray
+        Sorted int64 timestamps of the initial and final contacts [ns]
+    impact : numpy.ndarray
+        The peak acceleration of every initial contact
+    contact_time_range : list
+        A 2-list specifying the minimum and maximum expected contact time of a foot [ms]
+    step_time_range : list
+        A 2-list specifying the minimum and maximum expected duration of a step [ms]
+    as_float : bool
+        Optional whether to compute the durations from float timestamps, by default only when a contact could
+        not be paired
+
+    Returns
+    -------
+    dict(str, numpy.ndarray)
+        The columns of the steps, with the timestamps 't' as int64 [ns] and the position 'ic' of every step
+        in t_ic
+    numpy.ndarray
+        Positions in t_ic of the contacts that form a valid step, before the stride constraints are applied
+    """
+    contact_range = [pd.Timedelta(value, "ms").value for value in contact_time_range]
+    step_range = [pd.Timedelta(value, "ms").value for value in step_time_range]
+
+    contact_time = _pair_durations(
+        t_ic, t_fc, _pair_forward(t_ic, t_fc, contact_range), as_float
+    )
+    step_duration = _pair_durations(
+        t_ic, t_ic, _pair_forward(t_ic, t_ic, step_range), as_float
+    )
+
+    # double ic's lead to invalid step times, contact time cannot be longer than step time
+    valid = np.zeros(len(t_ic), dtype=bool)
+    valid[:-1] = np.diff(t_ic) > step_range[0]
+    valid &= step_duration > contact_time
+    valid = np.flatnonzero(valid)
+
+    # stride duration must be positive, also enforce maximum stride time
+    t = t_ic[valid]
+    stride_duration = (t[2:] - t[:-2]) / 1e6
+    kept = np.flatnonzero(stride_duration > 0)
+    rows, stride_duration = valid[kept], stride_duration[kept]
+
+    t = t_ic[rows]
+    kept = np.flatnonzero(t[2:] - t[:-2] < 2 * step_range[1])
+    rows, stride_duration = rows[kept], stride_duration[kept]
+
+    contact_time, step_duration = contact_time[rows], step_duration[rows]
+    steps = {
+        "ic": rows,
+        "t": t_ic[rows],
+        "impact": impact[rows],
+        "contact_time": contact_time,
+        "step_duration": step_duration,
+        "cadence": 60 / step_duration,
+        "stride_duration": stride_duration,
+        "flight_ratio": (step_duration - contact_time) / step_duration,
+    }
+
+    return steps, valid
+
+
+class StepDetector:
+    """
+    Streaming version of `gait_features_from_vertical_acceleration` that consumes the imu data in chunks, for
+    instance from `RawReader.iter_chunks` or `IMUStore.slice`, and returns the steps as soon as they are complete.
+
+    Only a short lookback of samples and the contacts of the last few steps are kept in memory. The contact
+    peaks are found with the same prominence and paired with the same contact and step time constraints, so
+    the steps are the same as those of the batch function as long as the prominence of a peak is decided
+    within the lookback (which for running data is within a single step).
+
+    Parameters
+    ----------
+    contact_time_range : list
+        A 2-list specifying the minimum and maximum expected contact time of a foot [ms]
+    step_time_range : list
+        A 2-list specifying the minimum and maximum expected duration of a step [ms]
+    prominence : float
+        Optional minimum prominence of the initial and final contact peaks
+    lookback : float
+        Optional duration of the samples kept before the newest sample to determine the prominence of peaks [s]
+    """
+
+    def __init__(
+        self,
+        contact_time_range=[50, 200],
+        step_time_range=[200, 1000],
+        prominence=1.5,
+        lookback=10,
+    ):
+        self.contact_time_range = contact_time_range
+        self.step_time_range = step_time_range
+        self.prominence = prominence
+        self.lookback = pd.Timedelta(lookback, "s").value
+
+        self._t = np.empty(0, dtype="int64")
+        self._a = np.empty(0, dtype="float64")
+
+        # per peak direction (1 for final contacts, -1 for initial contacts) the position in the buffer from
+        # which to look for new peaks and the found peaks [t, height, prominent] in order of time, of which
+        # the prominence may not be decided yet
+        self._scan = {1: 1, -1: 1}
+        self._peaks = {1: [], -1: []}
+
+        self._ic_t = np.empty(0, dtype="int64")
+        self._ic_impact = np.empty(0, dtype="float64")
+        self._fc_t = np.empty(0, dtype="int64")
+
+    def update(self, timestamps, a_vert):
+        """
+        Add the next chunk of imu data.
+
+        Parameters
+        ----------
+        timestamps : list
+            List of timestamps [ns] (or datetimes), continuing the timestamps of the previous chunk
+        a_vert : list
+            List with the same length as the timestamps with the vertical acceleration component
+
+        Returns
+        -------
+        pandas.DataFrame
+            The steps that were completed by this chunk, with the columns of
+            `gait_features_from_vertical_acceleration`
+        """
+        t = np.asarray(timestamps).astype("datetime64[ns]").view("int64")
+        a = np.asarray(a_vert, dtype="float64")
+
+        new = len(self._t)
+        self._t = np.concatenate([self._t, t])
+        self._a = np.concatenate([self._a, a])
+
+        return self._detect(new, final=False)
+
+    def flush(self):
+        """
+        Mark the end of the data and return the remaining steps. The detector can not be updated afterwards.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The last steps, with the columns of `gait_features_from_vertical_acceleration`
+        """
+        return self._detect(len(self._t), final=True)
+
+    def _detect(self, new, final):
+        t_known = []
+        for direction in [1, -1]:
+            t, height, t_undecided = self._find_peaks(direction, new, final)
+            if direction == 1:
+                self._fc_t = np.append(self._fc_t, t)
+            else:
+                self._ic_t = np.append(self._ic_t, t)
+                self._ic_impact = np.append(self._ic_impact, height)
+            t_known.append(t_undecided)
+
+        steps = self._complete_steps(None if final else min(t_known))
+
+        # keep the samples to find new peaks and determine their prominence
+        scan = min(self._scan.values()) - 1
+        if len(self._t) > 0:
+            cut = np.searchsorted(self._t, self._t[-1] - self.lookback, side="left")
+            cut = max(min(scan, cut), 0)
+            self._t, self._a = self._t[cut:], self._a[cut:]
+            self._scan = {direction: pos - cut for direction, pos in self._scan.items()}
+
+        return steps
+
+    def _find_peaks(self, direction, new, final):
+        from scipy.signal import find_peaks, peak_prominences
+
+        x = direction * self._a
+        peaks = self._peaks[direction]
+
+        # continue determining the prominence to the right of the undecided peaks
+        for peak in peaks:
+            if peak[2] is None:
+                peak[2] = _prominent_side(peak[1], x[new:], self.prominence)
+
+        # new local maxima, of which the plateau ends before the last sample
+        scan = self._scan[direction]
+        if len(x) > scan:
+            candidates = find_peaks(x[scan - 1 :])[0] + scan - 1
+            prominences, left_bases, _ = peak_prominences(x, candidates)
+
+            # the prominence can still grow when there is no higher sample to the right of the peak
+            higher = np.maximum.accumulate(x[::-1])[::-1]
+            higher = np.append(higher, -np.inf)[candidates + 1] > x[candidates]
+            left = x[candidates] - x[left_bases] >= self.prominence
+            for pos, prominent, left, higher in zip(
+                candidates, prominences >= self.prominence, left, higher
+            ):
+                if prominent or left:
+                    decided = True if prominent else (False if higher else None)
+                    peaks.append([self._t[pos], x[pos], decided])
+
+            last = np.flatnonzero(x[:-1] != x[-1])
+            self._scan[direction] = last[-1] + 1 if len(last) > 0 else 0
+
+        if final:
+            for peak in peaks:
+                peak[2] = peak[2] or False
+
+        # collect the peaks up to the first one that is undecided
+        count = next((i for i, peak in enumerate(peaks) if peak[2] is None), len(peaks))
+        decided, self._peaks[direction] = peaks[:count], peaks[count:]
+        accepted = [peak for peak in decided if peak[2]]
+        t = np.array([peak[0] for peak in accepted], dtype="int64")
+        height = np.array([peak[1] for peak in accepted], dtype="float64")
+
+        if final:
+            t_undecided = None
+        elif count < len(peaks):
+            t_undecided = peaks[count][0]
+        elif len(self._t) > 0:
+            t_undecided = self._t[min(self._scan[direction], len(self._t) - 1)]
+        else:
+            t_undecided = np.iinfo("int64").min
+
+        return t, height, t_undecided
+
+    def _complete_steps(self, t_known):
+        """
+        Get the steps that can no longer change now that all contacts before t_known are found (None when all
+        contacts are found), and forget the contacts that are no longer needed.
+        """
+        t_ic, step_range = self._ic_t, self.step_time_range
+        steps, valid = _steps_from_contacts(
+            t_ic,
+            self._ic_impact,
+            self._fc_t,
+            self.contact_time_range,
+            step_range,
+            as_float=True,
+        )
+
+        if t_known is None:
+            boundary = len(t_ic)
+        else:
+            # a contact is a valid step or not once its pairs and the next contact are known
+            max_delay = pd.Timedelta(
+                max(self.contact_time_range[1], step_range[1]), "ms"
+            ).value
+            known = np.searchsorted(t_ic + max_delay, t_known, side="left")
+            known = max(min(known, len(t_ic) - 1), 0)
+            valid = valid[valid < known]
+
+            # the stride constraints of a valid step depend on the four valid steps after it, unless the
+            # second valid step after it is certainly too late
+            t_valid = t_ic[valid]
+            t_next = np.append(t_valid[2:], t_ic[[known] * min(2, len(valid))])
+            complete = np.arange(len(valid)) + 4 < len(valid)
+            complete |= t_next - t_valid >= 2 * pd.Timedelta(step_range[1], "ms").value
+
+            count = np.argmin(complete) if not complete.all() else len(valid)
+            boundary = valid[count] if count < len(valid) else known
+
+        rows = steps["ic"] < boundary
+        df = pd.DataFrame(
+            {column: values[rows] for column, values in steps.items() if column != "ic"}
+        )
+        df["t"] = df["t"].values.view("datetime64[ns]")
+
+        if boundary > 0:
+            t_first = t_ic[boundary] if boundary < len(t_ic) else np.iinfo("int64").max
+            self._ic_t = self._ic_t[boundary:]
+            self._ic_impact = self._ic_impact[boundary:]
+            self._fc_t = self._fc_t[self._fc_t >= t_first]
+
+        return df
+
+
+def _prominent_side(height, x, prominence):
+    """
+    Whether the samples on one side of a peak, starting next to it, drop by the prominence before they rise
+    above the peak. None if the samples end before either happens.
+    """
+    above = x > height
+    end = np.argmax(above) if above.any() else len(x)
+    if np.any(height - x[:end] >= prominence):
+        return True
+
+    return False if end < len(x) else None
+
+
 def gait_symmety_index_from_acceleration(
     ax, ay, az, maxlag=150, deadlag=50, sample_rate=100
 ):
@@ -185,24 +469,37 @@ def gait_symmety_index_from_acceleration(
     if len(ax) <= deadlag:
         return np.nan, np.nan
 
-    # design 2nd order lp-butterworth filter
     from scipy import signal
 
-    sos = signal.butter(2, 10, "low", fs=sample_rate, output="sos")
+    sos = _lowpass_filter(sample_rate)
     fax = signal.sosfilt(sos, ax)
     fay = signal.sosfilt(sos, ay)
     faz = signal.sosfilt(sos, az)
 
-    # use the unbiased autocorrelation (does not taper) to get unbiased value
-    ARx = autocorrelate(fax)[:maxlag]
-    ARy = autocorrelate(fay)[:maxlag]
-    ARz = autocorrelate(faz)[:maxlag]
+    return _gait_symmetry_index(fax, fay, faz, maxlag, deadlag, sample_rate)
+
+
+@lru_cache()
+def _lowpass_filter(sample_rate):
+    """The 2nd order lp-butterworth filter applied to the acceleration, designed once per sample rate."""
+    from scipy import signal
+
+    return signal.butter(2, 10, "low", fs=sample_rate, output="sos")
+
+
+def _gait_symmetry_index(fax, fay, faz, maxlag, deadlag, sample_rate):
+    """The GSI and stride duration of filtered acceleration, see `gait_symmety_index_from_acceleration`."""
+    # use the unbiased autocorrelation (does not taper) to get unbiased value, only computing the lags
+    # up to maxlag directly as a dot product per lag
+    ARx = autocorrelate(fax, maxlag=maxlag, method="direct")
+    ARy = autocorrelate(fay, maxlag=maxlag, method="direct")
+    ARz = autocorrelate(faz, maxlag=maxlag, method="direct")
     Cstep = np.sqrt(ARx ** 2 + ARy ** 2 + ARz ** 2)
 
     # use biased autocorrelation (tapers off) to ensure getting the first peak
-    ARx = autocorrelate(fax, unbiased=False)[:maxlag]
-    ARy = autocorrelate(fay, unbiased=False)[:maxlag]
-    ARz = autocorrelate(faz, unbiased=False)[:maxlag]
+    ARx = autocorrelate(fax, unbiased=False, maxlag=maxlag, method="direct")
+    ARy = autocorrelate(fay, unbiased=False, maxlag=maxlag, method="direct")
+    ARz = autocorrelate(faz, unbiased=False, maxlag=maxlag, method="direct")
 
     ARx[ARx < 0] = 0
     ARy[ARy < 0] = 0
@@ -214,3 +511,186 @@ def gait_symmety_index_from_acceleration(
     stride_duration = Tstride / sample_rate
 
     return 1 - GSI, stride_duration
+
+
+def gait_symmetry_index_per_range(
+    ax,
+    ay,
+    az,
+    starts,
+    ends,
+    maxlag=150,
+    deadlag=50,
+    sample_rate=100,
+    max_workers=None,
+):
+    """
+    Determine the gait symmetry index (GSI) for many ranges of the 3-axes acceleration at once, such as all
+    bouts of a run. Every range gives the same result as `gait_symmety_index_from_acceleration` on its samples,
+    but the filter is designed once and the ranges are computed concurrently.
+
+    Parameters
+    ----------
+    ax, ay, az : numpy.ndarray
+        The three axes of acceleration of the whole recording, direction is not important but should not change
+    starts, ends : numpy.ndarray
+        Position of the first sample and the position after the last sample of every range
+    maxlag : float
+        Maximum lag to compute the autocorrelation and expect a peak. Units is in samples.
+    deadlag : float
+        Minimum lag to compute the autocorrelation and expect a peak. Units is in samples.
+    sample_rate : float
+        Expected sampling rate of the data
+    max_workers : int
+        Optional maximum number of ranges that is computed concurrently, defaults to one thread per core
+        (plus four). If 1, all ranges are computed in the calling thread.
+
+    Returns
+    -------
+    numpy.ndarray
+        The complement of the gsi per range, meaning 0 = symmetric, 1 = asymmetric
+    numpy.ndarray
+        Lag corresponding to the stride duration per range (in seconds)
+    """
+    from scipy import signal
+
+    sos = _lowpass_filter(sample_rate)
+
+    def gsi_of_range(idx):
+        start, end = starts[idx], ends[idx]
+        if end - start <= deadlag:
+            return np.nan, np.nan
+
+        fax = signal.sosfilt(sos, ax[start:end])
+        fay = signal.sosfilt(sos, ay[start:end])
+        faz = signal.sosfilt(sos, az[start:end])
+
+        return _gait_symmetry_index(fax, fay, faz, maxlag, deadlag, sample_rate)
+
+    if max_workers == 1:
+        results = [gsi_of_range(idx) for idx in range(len(starts))]
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            results = list(executor.map(gsi_of_range, range(len(starts))))
+
+    gsi = np.array([result[0] for result in results], dtype="float64")
+    stride_duration = np.array([result[1] for result in results], dtype="float64")
+
+    return gsi, stride_duration
+
+
+def rolling_gait_symmetry_index(
+    timestamps,
+    ax,
+    ay,
+    az,
+    window=10,
+    hop=1,
+    maxlag=150,
+    deadlag=50,
+    sample_rate=100,
+):
+    """
+    Determine the gait symmetry index (GSI) in a sliding window over a whole recording, giving a trace of the
+    symmetry over time instead of a single value per bout.
+
+    The acceleration is filtered once and the lagged products of the filtered signal are summed cumulatively,
+    so the autocorrelation of every window follows from the difference of two running sums per lag instead of
+    being recomputed. Unlike `gait_symmety_index_from_acceleration` the filter is therefore not restarted for
+    every window.
+
+    Parameters
+    ----------
+    timestamps : list
+        List of timestamps [ns]
+    ax, ay, az : list
+        List of the three axes of acceleration, direction is not important but should not change
+    window : float
+        Duration of the sliding window in seconds, at least maxlag samples
+    hop : float
+        Time between the start of two consecutive windows in seconds
+    maxlag : float
+        Maximum lag to compute the autocorrelation and expect a peak. Units is in samples.
+    deadlag : float
+        Minimum lag to compute the autocorrelation and expect a peak. Units is in samples.
+    sample_rate : float
+        Expected sampling rate of the data
+
+    Returns
+    -------
+    pandas.DataFrame
+        Index:
+            RangeIndex
+        Columns:
+            Name: t_start, dtype: datetime64[ns]
+                Timestamp of the first sample in the window
+            Name: t_end, dtype: datetime64[ns]
+                Timestamp of the last sample in the window
+            Name: gsi, dtype: float64
+                The complement of the gsi, meaning 0 = symmetric, 1 = asymmetric
+            Name: stride_duration, dtype: float64
+                Lag corresponding to the stride duration [ms]
+            Name: cadence, dtype: float64
+                Steps per minute, derived from stride_duration
+    """
+    from scipy import signal
+
+    size = int(round(window * sample_rate))
+    step = max(int(round(hop * sample_rate)), 1)
+    if size < maxlag:
+        raise ValueError("The window must contain at least maxlag samples")
+
+    n = len(timestamps)
+    starts = np.arange(0, max(n - size + 1, 0), step)
+    if len(starts) == 0:
+        # the recording is shorter than a single window
+        return pd.DataFrame(
+            {
+                "t_start": pd.Series(dtype="datetime64[ns]"),
+                "t_end": pd.Series(dtype="datetime64[ns]"),
+                "gsi": pd.Series(dtype="float64"),
+                "stride_duration": pd.Series(dtype="float64"),
+                "cadence": pd.Series(dtype="float64"),
+            }
+        )
+
+    lags = np.arange(maxlag)
+
+    sos = _lowpass_filter(sample_rate)
+    running_sum = np.zeros(n + 1)
+
+    unbiased, biased = [], []
+    for acc in [ax, ay, az]:
+        filtered = signal.sosfilt(sos, np.asarray(acc, dtype="float64"))
+
+        # lagged products of each window from the running sums of the products over the whole recording
+        correlation = np.empty((len(starts), maxlag))
+        for lag in lags:
+            products = filtered[lag:] * filtered[: n - lag]
+            np.cumsum(products, out=running_sum[1 : n - lag + 1])
+            correlation[:, lag] = running_sum[starts + size - lag] - running_sum[starts]
+
+        unbiased_correlation = correlation / (size - lags)
+        unbiased.append(unbiased_correlation / unbiased_correlation[:, :1])
+        biased.append(correlation / correlation[:, :1])
+
+    # the same gsi computation as for a single bout, for all windows at once
+    Cstep = np.sqrt(unbiased[0] ** 2 + unbiased[1] ** 2 + unbiased[2] ** 2)
+    Cstride = sum(np.maximum(correlation, 0) for correlation in biased)
+    Tstride = deadlag + np.argmax(Cstride[:, deadlag:], axis=1)
+    GSI = Cstep[np.arange(len(starts)), Tstride // 2] / np.sqrt(3)
+
+    stride_duration = Tstride / sample_rate
+    timestamps = pd.to_datetime(np.asarray(timestamps))
+
+    return pd.DataFrame(
+        {
+            "t_start": timestamps[starts],
+            "t_end": timestamps[starts + size - 1],
+            "gsi": 1 - GSI,
+            "stride_duration": stride_duration * 1000,
+            "cadence": 2 * 60 / stride_duration,
+        }
+    )
@@ -0,0 +1,249 @@
+""" Memory-mapped storage of imu data
+
+An on-disk columnar store for the (100Hz) phone motion data, so long recordings can be sliced by time
+without loading them into memory.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+
+
+class IMUStore:
+    """
+    On-disk, memory-mapped columnar store of imu data, such as the DataFrame returned by
+    `RawReader.get_phone_motion_df`.
+
+    A store is a directory holding one binary file per column: the timestamps as int64 [ns] and every
+    channel with a fixed-width float dtype. The rows are ordered by time, so a time range is found by
+    binary search and returned as NumPy views on the memory-mapped files.
+
+    Parameters
+    ----------
+    path : str
+        The directory of an existing store, see `IMUStore.create`
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+        with open(os.path.join(path, "meta.json"), "r") as fh:
+            self.dtypes = json.load(fh)["dtypes"]
+        self.channels = [column for column in self.dtypes if column != "t"]
+
+        self._open()
+
+    @classmethod
+    def create(
+        cls,
+        path,
+        channels=["ax", "ay", "az", "gx", "gy", "gz", "a_vert", "rx", "ry", "rz"],
+        dtype="float64",
+    ):
+        """
+        Create a new, empty store.
+
+        Parameters
+        ----------
+        path : str
+            The directory to create the store in
+        channels : list
+            Optional names of the channel columns to store
+        dtype : str
+            Optional dtype of the channels, 'float64' or 'float32' to halve the size of the store
+
+        Returns
+        -------
+        IMUStore
+            The empty store, add data to it with `append`
+        """
+        os.makedirs(path, exist_ok=True)
+
+        dtypes = {"t": "int64"}
+        for channel in channels:
+            dtypes[channel] = dtype
+
+        for column in dtypes:
+            open(os.path.join(path, column + ".bin"), "wb").close()
+        with open(os.path.join(path, "meta.json"), "w") as fh:
+            json.dump({"dtypes": dtypes}, fh)
+
+        return cls(path)
+
+    @classmethod
+    def from_frame(cls, path, df, **kwargs):
+        """
+        Create a new store containing the data of a DataFrame.
+
+        Parameters
+        ----------
+        path : str
+            The directory to create the store in
+        df : pandas.DataFrame
+            The imu data with a timestamp column 't' and the channel columns
+        kwargs
+            Optional arguments passed to `create`
+
+        Returns
+        -------
+        IMUStore
+            The store with the data of df
+        """
+        store = cls.create(path, **kwargs)
+        store.append(df.sort_values(by="t", kind="mergesort"))
+
+        return store
+
+    def _open(self):
+        self._columns = {}
+        for column, dtype in self.dtypes.items():
+            filename = os.path.join(self.path, column + ".bin")
+            if os.path.getsize(filename) == 0:
+                self._columns[column] = np.empty(0, dtype=dtype)
+            else:
+                self._columns[column] = np.memmap(filename, dtype=dtype, mode="r")
+
+    def __len__(self):
+        return len(self._columns["t"])
+
+    def append(self, df):
+        """
+        Append imu data to the end of the store.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            The imu data with a timestamp column 't' and the channel columns of the store, sorted by time
+            and starting not before the last timestamp in the store
+        """
+        if len(df) == 0:
+            return
+
+        t = pd.to_numeric(df["t"]).values
+        if np.any(np.diff(t) < 0) or (len(self) > 0 and t[0] < self._columns["t"][-1]):
+            raise ValueError("IMU data must be appended in time order")
+
+        missing = [
+            column for column in self.dtypes if column != "t" and column not in df
+        ]
+        if len(missing) > 0:
+            raise ValueError("IMU data misses the columns {}".format(missing))
+
+        # convert all columns before writing any, so a failing conversion leaves the store intact
+        arrays = {
+            column: np.ascontiguousarray(
+                t if column == "t" else df[column].values, dtype=dtype
+            )
+            for column, dtype in self.dtypes.items()
+        }
+        for column, values in arrays.items():
+            with open(os.path.join(self.path, column + ".bin"), "ab") as fh:
+                values.tofile(fh)
+
+        self._open()
+
+    def column(self, name):
+        """
+        Get all values of a column.
+
+        Parameters
+        ----------
+        name : str
+            Name of the column, 't' for the timestamps [ns]
+
+        Returns
+        -------
+        numpy.ndarray
+            Memory-mapped (read-only) values of the column
+        """
+        return self._columns[name]
+
+    def slice_index(self, t_start, t_end, inclusive="left"):
+        """
+        Find the positional range of the rows within a time range by binary search.
+
+        Parameters
+        ----------
+        t_start, t_end : pandas.Timestamp
+            Start and end of the time range (or int64 timestamps [ns]), None for an open end
+        inclusive : str
+            Optional which ends of the range to include: 'both', 'left', 'right' or 'neither'
+
+        Returns
+        -------
+        int
+            Position of the first row in the range
+        int
+            Position after the last row in the range
+        """
+        t = self._columns["t"]
+        start = (
+            0
+            if t_start is None
+            else np.searchsorted(
+                t,
+                pd.Timestamp(t_start).value,
+                side="left" if inclusive in ["both", "left"] else "right",
+            )
+        )
+        end = (
+            len(t)
+            if t_end is None
+            else np.searchsorted(
+                t,
+                pd.Timestamp(t_end).value,
+                side="right" if inclusive in ["both", "right"] else "left",
+            )
+        )
+
+        return int(start), int(max(start, end))
+
+    def slice(self, t_start, t_end, columns=None, inclusive="left"):
+        """
+        Get the data within a time range as zero-copy views on the store.
+
+        Parameters
+        ----------
+        t_start, t_end : pandas.Timestamp
+            Start and end of the time range (or int64 timestamps [ns]), None for an open end
+        columns : list
+            Optional columns to return, defaults to the timestamps and all channels
+        inclusive : str
+            Optional which ends of the range to include: 'both', 'left', 'right' or 'neither'
+
+        Returns
+        -------
+        dict(str, numpy.ndarray)
+            Memory-mapped (read-only) values per column, with the timestamps 't' as int64 [ns]
+        """
+        start, end = self.slice_index(t_start, t_end, inclusive=inclusive)
+        columns = list(self.dtypes) if columns is None else columns
+
+        return {column: self._columns[column][start:end] for column in columns}
+
+    def to_frame(self, t_start=None, t_end=None, columns=None, inclusive="left"):
+        """
+        Load (a time range of) the data into a Pandas DataFrame.
+
+        Parameters
+        ----------
+        t_start, t_end : pandas.Timestamp
+            Optional start and end of the time range, defaults to all data
+        columns : list
+            Optional columns to return, defaults to the timestamps and all channels
+        inclusive : str
+            Optional which ends of the range to include: 'both', 'left', 'right' or 'neither'
+
+        Returns
+        -------
+        pandas.DataFrame
+            A DataFrame with a copy of the data, the timestamps 't' as datetime64[ns]
+        """
+        data = self.slice(t_start, t_end, columns=columns, inclusive=inclusive)
+
+        df = pd.DataFrame({column: np.array(values) for column, values in data.items()})
+        if "t" in df:
+            df["t"] = df["t"].values.view("datetime64[ns]")
+
+        return df
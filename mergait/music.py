@@ -32,38 +32,44 @@ def merge_music_playstate(df, df_music, columns=["t", "track_uri"]):
 
     df = df.copy()
 
-    # tracks may occur multiple times in the dataset, so we group not per track but per track-boundary
-    df_music = pd.DataFrame(df_music)
-    df_music["__temp"] = (df_music.track_uri != df_music.track_uri.shift()).cumsum()
-    df_music_songs = df_music.groupby(by=["__temp"], sort=False)
-
     # merge simple properties, making sure track_uri remains categorical
     df = pd.merge_asof(
         df, df_music[["t", "track_uri"]].dropna(), on="t", direction="backward"
     )
 
-    # for the playhead position we must interpolate the data, except for when the playstate is paused
-    keys = list(df_music_songs.groups.keys())
-    for idx in range(len(df_music_songs)):
-        is_last = idx + 1 == len(df_music_songs)
-
-        song = df_music_songs.get_group(keys[idx])
-        next_song = False if is_last else df_music_songs.get_group(keys[idx + 1])
-
-        song_valid = song["paused"]
-        song_bouts = extract_bouts(song, song_valid, keep_invalid=True)
+    # tracks may occur multiple times in the dataset, so we group not per track but per track-boundary,
+    # and split all songs at once into segments of constant playstate
+    song = (df_music.track_uri != df_music.track_uri.shift()).cumsum()
+    paused = df_music["paused"]
+    segment = ((song != song.shift()) | (paused != paused.shift())).cumsum().values
+    song = song.values
 
-        # pad last bout to the beginning of next song, so remember the last state until song finishes
-        if is_last:
-            song_bouts.tail(1).t_end = df.t.max()
-        else:
-            song_bouts.tail(1).t_end = next_song.t.iloc[0]
+    df_songs = pd.DataFrame(
+        {"t": df_music.t.values, "position": df_music.position.values, "song": song}
+    )
+    song_bouts = (
+        df_songs.assign(valid=paused.values)
+        .groupby(segment, sort=False)
+        .agg(
+            t_start=("t", "min"),
+            t_end=("t", "max"),
+            valid=("valid", "first"),
+            song=("song", "first"),
+        )
+        .reset_index(drop=True)
+    )
 
+    if len(song_bouts) > 0:
         # add filter for when there is no music yet, or music is paused
         add_bouts_as_column(df, song_bouts, new_column="bad_no_music", reset_value=True)
-        # interpolate and extrapolate play position
+        # interpolate and extrapolate play position within the song of every segment
         interpolate_bouts_as_column(
-            df, song, song_bouts, new_column="position", value_column="position"
+            df,
+            df_songs,
+            song_bouts,
+            new_column="position",
+            value_column="position",
+            by="song",
         )
 
     # remove playstate position when no music is playing
@@ -170,7 +176,7 @@ def get_music_features_per_section(
         agg_funs["pitch_" + str(a + 1)] = [np.mean, np.std]
         agg_funs["timbre_" + str(a + 1)] = [np.mean, np.std]
 
-    df = df.groupby(["track_uri", "section"]).agg(agg_funs)
+    df = df.groupby(["track_uri", "section"], observed=True).agg(agg_funs)
     df.columns = df.columns.map(lambda x: "_".join(a for a in x if a != "first"))
 
     df.rename(
@@ -225,7 +231,7 @@ def get_music_features_per_track(df_features, df_segments, track_uris=None):
         agg_funs["pitch_" + str(a + 1)] = [np.mean, np.std]
         agg_funs["timbre_" + str(a + 1)] = [np.mean, np.std]
 
-    df = df.groupby(["track_uri"]).agg(agg_funs)
+    df = df.groupby(["track_uri"], observed=True).agg(agg_funs)
     df.columns = df.columns.map(lambda x: "_".join(a for a in x if a != "first"))
     df.reset_index(drop=True, inplace=True)
 
@@ -1,4 +1,523 @@
+import hashlib
+import json
+import os
+import time
+import numpy as np
 import pandas as pd
+from operator import itemgetter
+from mergait.utility import *
+
+
+def _seconds_to_datetime(seconds):
+    """
+    Convert an array of (float) unix timestamps in seconds to datetime64[ns] values, rounding exactly
+    like `pandas.Timestamp(t, unit="s")` does for a single value.
+
+    Parameters
+    ----------
+    seconds : numpy.ndarray
+        Array of timestamps [s]
+
+    Returns
+    -------
+    numpy.ndarray
+        Array of dtype datetime64[ns]
+    """
+    missing = np.isnan(seconds)
+    seconds = np.where(missing, 0, seconds)
+
+    base = np.trunc(seconds)
+    frac = np.round(seconds - base, 9)
+    ns = base.astype("int64") * 1000000000 + (frac * 1e9).astype("int64")
+    ns[missing] = np.iinfo("int64").min
+
+    return ns.view("datetime64[ns]")
+
+
+def _json_decoder(decoder="auto"):
+    """
+    Get the function that decodes a single JSON line.
+
+    Parameters
+    ----------
+    decoder : str
+        Name of the decoder: 'json', 'orjson', 'simdjson' or 'auto' (orjson if installed, else json)
+
+    Returns
+    -------
+    function
+        Function that converts a JSON str or bytes into a dict
+    """
+    if decoder == "auto":
+        try:
+            import orjson
+
+            return orjson.loads
+        except ImportError:
+            return json.loads
+
+    if decoder == "orjson":
+        import orjson
+
+        return orjson.loads
+
+    if decoder == "simdjson":
+        import simdjson
+
+        return simdjson.loads
+
+    return json.loads
+
+
+def _categorical(codes, categories):
+    """
+    Create a pandas.Categorical from codes into a list of categories, which may contain None.
+    Like `astype("category")` the categories of the result are sorted.
+    """
+    order = sorted(
+        (idx for idx, category in enumerate(categories) if category is not None),
+        key=lambda idx: categories[idx],
+    )
+
+    recode = np.full(len(categories), -1, dtype="int32")
+    recode[order] = np.arange(len(order))
+
+    return pd.Categorical.from_codes(recode[codes], [categories[idx] for idx in order])
+
+
+class _ColumnBuffer:
+    """
+    Growable, typed column storage for the rows of a single data stream.
+
+    All numeric columns (kinds 'float', 'int' and 'time') share one 2D float64 block that doubles in
+    capacity when full, so a row is written with a single assignment. Repeated strings (kind 'category')
+    are stored as integer codes into a table of categories and other values (kinds 'bool' and 'object') in an
+    object array. Values of 'int' columns are returned as int64 when they are all integral, 'time' columns hold
+    unix timestamps [s] and are returned as datetime64[ns]. Empty 'bool' columns are returned as bool, so the
+    dtype of a chunk without rows matches that of the other chunks.
+    """
+
+    def __init__(self, schema, capacity=1024):
+        self.schema = schema
+
+        numeric = [
+            idx
+            for kind in ["float", "int", "time"]
+            for idx, (_, k) in enumerate(schema)
+            if k == kind
+        ]
+        self._numeric_rows = {schema[idx][0]: row for row, idx in enumerate(numeric)}
+        self._float_count = sum(1 for _, kind in schema if kind == "float")
+        self._get_numeric = itemgetter(*numeric)
+        self._other = [
+            idx for idx, (_, kind) in enumerate(schema) if idx not in numeric
+        ]
+
+        self._initial_capacity = capacity
+        self.clear()
+
+    def __len__(self):
+        return self._size
+
+    def clear(self):
+        """
+        Drop all rows. New arrays are allocated, so DataFrames handed out earlier remain valid.
+        """
+        self._size = 0
+        self._capacity = self._initial_capacity
+        self._block = np.empty(
+            (len(self._numeric_rows), self._capacity), dtype="float64"
+        )
+        self._objects = {
+            idx: np.empty(
+                self._capacity, dtype="int32" if kind == "category" else "object"
+            )
+            for idx, (_, kind) in enumerate(self.schema)
+            if idx in self._other
+        }
+        self._categories = {
+            idx: {} for idx, (_, kind) in enumerate(self.schema) if kind == "category"
+        }
+
+    def _reserve(self, size):
+        if size <= self._capacity:
+            return
+
+        capacity = self._capacity
+        while capacity < size:
+            capacity *= 2
+
+        block = np.empty((self._block.shape[0], capacity), dtype="float64")
+        block[:, : self._size] = self._block[:, : self._size]
+        self._block = block
+
+        for idx, values in self._objects.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[: self._size] = values[: self._size]
+            self._objects[idx] = grown
+
+        self._capacity = capacity
+
+    def append(self, row):
+        """
+        Append a single row.
+
+        Parameters
+        ----------
+        row : tuple
+            The values of the row, in the order of the schema
+        """
+        self._reserve(self._size + 1)
+
+        self._block[:, self._size] = self._get_numeric(row)
+        for idx in self._other:
+            value = row[idx]
+            if idx in self._categories:
+                codes = self._categories[idx]
+                value = codes.setdefault(value, len(codes))
+            self._objects[idx][self._size] = value
+
+        self._size += 1
+
+    def extend(self, rows):
+        """
+        Append a batch of rows, converting each column in a single pass.
+
+        Parameters
+        ----------
+        rows : list(tuple)
+            The rows to append, with the values in the order of the schema
+        """
+        if len(rows) == 0:
+            return
+
+        start, end = self._size, self._size + len(rows)
+        self._reserve(end)
+
+        self._block[:, start:end] = np.array(
+            [self._get_numeric(row) for row in rows], dtype="float64"
+        ).T
+        for idx in self._other:
+            values = [row[idx] for row in rows]
+            if idx in self._categories:
+                codes = self._categories[idx]
+                values = [codes.setdefault(value, len(codes)) for value in values]
+            self._objects[idx][start:end] = values
+
+        self._size = end
+
+    def extend_columns(self, columns):
+        """
+        Append a batch of rows given per column, as returned by `to_raw_frame`.
+
+        Parameters
+        ----------
+        columns : pandas.DataFrame
+            The stored values of every column of the schema
+        """
+        if len(columns) == 0:
+            return
+
+        start, end = self._size, self._size + len(columns)
+        self._reserve(end)
+
+        for idx, (name, kind) in enumerate(self.schema):
+            values = columns[name].values
+            if kind == "category":
+                codes = self._categories[idx]
+                values = [codes.setdefault(value, len(codes)) for value in values]
+
+            if name in self._numeric_rows:
+                self._block[self._numeric_rows[name], start:end] = values
+            else:
+                self._objects[idx][start:end] = values
+
+        self._size = end
+
+    def column(self, name):
+        """
+        Get the stored values of a column, without conversion of its kind.
+
+        Parameters
+        ----------
+        name : str
+            Name of the column
+
+        Returns
+        -------
+        numpy.ndarray
+            View on the stored values, category columns are returned as codes
+        """
+        if name in self._numeric_rows:
+            return self._block[self._numeric_rows[name], : self._size]
+
+        idx = [n for n, _ in self.schema].index(name)
+        return self._objects[idx][: self._size]
+
+    def categories(self, name):
+        """
+        Get the categories of a category column, in the order of their codes.
+
+        Parameters
+        ----------
+        name : str
+            Name of the column
+
+        Returns
+        -------
+        list
+            The values belonging to the codes 0, 1, 2, ...
+        """
+        idx = [n for n, _ in self.schema].index(name)
+        return list(self._categories[idx].keys())
+
+    def to_raw_frame(self, start=0):
+        """
+        Convert the stored values into a DataFrame without conversion of their kind, except that
+        categories are decoded. Appending it with `extend_columns` restores the rows exactly.
+
+        Parameters
+        ----------
+        start : int
+            Optional index of the first row to include
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame with the columns of the schema
+        """
+        columns = {}
+        for name, kind in self.schema:
+            values = self.column(name)[start:]
+            if kind == "category":
+                values = np.array(self.categories(name), dtype="object")[values]
+            columns[name] = values
+
+        return pd.DataFrame(columns)
+
+    def to_frame(self, compact=False, copy=True):
+        """
+        Convert the buffer into a DataFrame.
+
+        Parameters
+        ----------
+        compact : bool
+            Optional whether to return the category columns as pandas.Categorical instead of object
+        copy : bool
+            Optional whether to copy the float columns. If False they are a view on the buffer, which is only
+            safe when the buffer is cleared (or discarded) before the DataFrame is handed out
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame with the columns of the schema
+        """
+        float_names = [name for name, kind in self.schema if kind == "float"]
+        df = pd.DataFrame(
+            self._block[: self._float_count, : self._size].T,
+            columns=float_names,
+            copy=copy,
+        )
+
+        for pos, (name, kind) in enumerate(self.schema):
+            if kind == "float":
+                continue
+
+            values = self.column(name)
+            if kind == "time":
+                values = _seconds_to_datetime(values)
+            elif kind == "int":
+                if np.all(np.isfinite(values)) and np.all(values == np.trunc(values)):
+                    values = values.astype("int64")
+            elif kind == "category" and compact:
+                values = _categorical(values, self.categories(name))
+            elif kind == "category":
+                values = np.array(self.categories(name), dtype="object")[values]
+            elif kind == "bool" and len(values) == 0:
+                values = values.astype("bool")
+            else:
+                values = pd.Series(values, index=df.index).infer_objects()
+
+            df.insert(pos, name, values)
+
+        return df
+
+
+def _parse_phone_activity(msg):
+    pedo = msg["pedo"]
+    return (
+        msg["t"],
+        pedo["activity"],
+        0 if pedo["pace"] == 0 else 1.0 / pedo["pace"],
+        pedo["step"],
+        pedo["cadence"] * 60,
+        pedo["floorsAscended"] if "floorsAscended" in pedo else 0,
+        pedo["floorsDescended"] if "floorsDescended" in pedo else 0,
+    )
+
+
+def _parse_phone_motion(msg):
+    a, ag, r = msg["motion"]["a"], msg["motion"]["ag"], msg["motion"]["r"]
+    gx = ag[0] - a[0]
+    gy = ag[1] - a[1]
+    gz = ag[2] - a[2]
+    a_vert = a[0] * gx + a[1] * gy + a[2] * gz
+
+    return (msg["t"], a[0], a[1], a[2], gx, gy, gz, a_vert, r[0], r[1], r[2])
+
+
+def _parse_phone_location(msg):
+    location = msg["location"]
+    return (
+        location["timestamp"],
+        location["coordinate"]["lon"],
+        location["coordinate"]["lat"],
+        location["coordinate"]["acc"],
+        location["altitude"]["val"],
+        location["altitude"]["acc"],
+        location["course"]["val"],
+        location["course"]["acc"],
+        location["speed"]["val"],
+        location["speed"]["acc"],
+    )
+
+
+def _parse_footpods_sc(msg):
+    return (
+        msg["t"],
+        msg["runscribe"]["foot"],
+        msg["rsc"]["cadence"],
+        msg["rsc"]["speed"],
+    )
+
+
+def _parse_footpods(msg):
+    metrics = msg["metrics"]
+    return (
+        msg["t"],
+        msg["runscribe"]["foot"],
+        metrics["pronation"],
+        metrics["braking"],
+        metrics["impact"],
+        metrics["contactTime"],
+        metrics["flightRatio"],
+        metrics["strikeType"],
+        metrics["power"],
+    )
+
+
+def _parse_music(msg):
+    if "playstate" not in msg:
+        return None
+
+    playstate = msg["playstate"]
+    if "name" in playstate:
+        split_track = playstate["name"].split("-", 2)
+        artist, track = split_track[0].strip(), split_track[1].strip()
+    else:
+        artist, track = playstate["artist"], playstate["track"]
+
+    return (
+        msg["t"],
+        playstate["uri"],
+        playstate["paused"],
+        artist,
+        track,
+        playstate["contextUri"],
+        playstate["contextTitle"],
+        playstate["position"] / 1000,
+        playstate["repeatMode"] if "repeatMode" in msg else "off",
+        playstate["shuffle"] if "shuffle" in msg else False,
+        playstate["crossfadeState"] if "crossfadeState" in msg else False,
+    )
+
+
+# per stream: the message type, the function parsing a message into a row and the schema of the row
+_STREAMS = {
+    "footpods": (
+        "RunScribe-metrics",
+        _parse_footpods,
+        [
+            ("t", "time"),
+            ("foot", "category"),
+            ("pronation", "float"),
+            ("braking", "float"),
+            ("impact", "float"),
+            ("contact_time", "int"),
+            ("flight_ratio", "float"),
+            ("strike", "int"),
+            ("power", "int"),
+        ],
+    ),
+    "footpods_sc": (
+        "RunScribe-speedcadence",
+        _parse_footpods_sc,
+        [("t", "time"), ("foot", "category"), ("cadence", "int"), ("speed", "float")],
+    ),
+    "phone_activity": (
+        "iPhone-pedo",
+        _parse_phone_activity,
+        [
+            ("t", "time"),
+            ("activity", "category"),
+            ("speed", "float"),
+            ("step", "int"),
+            ("cadence", "float"),
+            ("floors_ascended", "int"),
+            ("floors_descended", "int"),
+        ],
+    ),
+    "phone_motion": (
+        "iPhone-motion",
+        _parse_phone_motion,
+        [
+            ("t", "time"),
+            ("ax", "float"),
+            ("ay", "float"),
+            ("az", "float"),
+            ("gx", "float"),
+            ("gy", "float"),
+            ("gz", "float"),
+            ("a_vert", "float"),
+            ("rx", "float"),
+            ("ry", "float"),
+            ("rz", "float"),
+        ],
+    ),
+    "music": (
+        "Spotify",
+        _parse_music,
+        [
+            ("t", "time"),
+            ("track_uri", "category"),
+            ("paused", "bool"),
+            ("artist", "category"),
+            ("track", "category"),
+            ("context_uri", "category"),
+            ("context", "category"),
+            ("position", "float"),
+            ("repeat_mode", "category"),
+            ("shuffle", "bool"),
+            ("crossfade", "bool"),
+        ],
+    ),
+    "phone_location": (
+        "iPhone-location",
+        _parse_phone_location,
+        [
+            ("t", "time"),
+            ("lon", "float"),
+            ("lat", "float"),
+            ("lonlat_acc", "float"),
+            ("alt", "float"),
+            ("alt_acc", "float"),
+            ("course", "float"),
+            ("course_acc", "float"),
+            ("speed", "float"),
+            ("speed_acc", "float"),
+        ],
+    ),
+}
 
 
 class RawReader:
@@ -7,17 +526,51 @@ class RawReader:
 
     The state can be updated by feeding it additional lines (msg) from the data file.
     You can then extract the data of the different sensors and modalities as Pandas dataframes.
+
+    Every stream is accumulated in typed column buffers instead of per-message objects. The returned
+    DataFrames are independent copies of these buffers, only `iter_chunks` hands out the buffers of a
+    chunk without copying them.
+
+    Parameters
+    ----------
+    streams : list
+        Optional names of the streams to read, e.g. ['footpods', 'music'], defaults to all streams:
+        'footpods', 'footpods_sc', 'phone_activity', 'phone_motion', 'music' and 'phone_location'.
+        Messages of other streams are skipped as early as possible and do not count towards the
+        timestamp range. The DataFrames of streams that are not read are empty.
+    compact : bool
+        Optional whether the `get_*_df` methods return compact dtypes: categoricals for repeated strings,
+        float32 for sensor channels and small integers for per-step values, see `utility.compact_dtypes`
     """
 
-    def __init__(self):
-        self.footpods = []
-        self.footpods_sc = []
-        self.phone_activity = []
-        self.phone_motion = []
-        self.music = []
-        self.phone_location = []
+    def __init__(self, streams=None, compact=False):
+        self.compact = compact
+        self.streams = [
+            stream for stream in _STREAMS if streams is None or stream in streams
+        ]
+
+        for stream, (_, _, schema) in _STREAMS.items():
+            setattr(
+                self,
+                stream,
+                _ColumnBuffer(schema, capacity=1024 if stream in self.streams else 1),
+            )
         self.t_range = []
 
+        self._parsers = {
+            _STREAMS[stream][0]: (_STREAMS[stream][1], getattr(self, stream))
+            for stream in self.streams
+        }
+
+        # quoted type values to find the lines of the requested streams before decoding them
+        self._needles = None
+        if streams is not None:
+            msg_types = ['"' + msg_type + '"' for msg_type in self._parsers]
+            self._needles = {
+                False: msg_types,
+                True: [msg_type.encode() for msg_type in msg_types],
+            }
+
     def update_with(self, msg):
         """
         Updates the class state with a new message from the raw data file.
@@ -29,126 +582,212 @@ class RawReader:
             Note, the raw JSON line must be first converted to a dict.
 
         """
+        if self._needles is not None and msg["type"] not in self._parsers:
+            return True
+
         if "t" in msg:
             t = msg["t"]
             self.t_range = [t, t] if self.t_range == [] else [self.t_range[0], t]
 
-        if msg["type"] == "iPhone-pedo":
-            self.phone_activity.append(
-                {
-                    "t": pd.Timestamp(msg["t"], unit="s"),
-                    "activity": msg["pedo"]["activity"],
-                    "speed": 0
-                    if msg["pedo"]["pace"] == 0
-                    else 1.0 / msg["pedo"]["pace"],
-                    "step": msg["pedo"]["step"],
-                    "cadence": msg["pedo"]["cadence"] * 60,
-                    "floors_ascended": msg["pedo"]["floorsAscended"]
-                    if "floorsAscended" in msg["pedo"]
-                    else 0,
-                    "floors_descended": msg["pedo"]["floorsDescended"]
-                    if "floorsDescended" in msg["pedo"]
-                    else 0,
-                }
-            )
+        if msg["type"] in self._parsers:
+            parse, buffer = self._parsers[msg["type"]]
+            row = parse(msg)
+            if row is not None:
+                buffer.append(row)
 
-        if msg["type"] == "iPhone-motion":
-            gx = msg["motion"]["ag"][0] - msg["motion"]["a"][0]
-            gy = msg["motion"]["ag"][1] - msg["motion"]["a"][1]
-            gz = msg["motion"]["ag"][2] - msg["motion"]["a"][2]
-            a_vert = (
-                msg["motion"]["a"][0] * gx
-                + msg["motion"]["a"][1] * gy
-                + msg["motion"]["a"][2] * gz
-            )
+        return True
 
-            self.phone_motion.append(
-                {
-                    "t": pd.Timestamp(msg["t"], unit="s"),
-                    "ax": msg["motion"]["a"][0],
-                    "ay": msg["motion"]["a"][1],
-                    "az": msg["motion"]["a"][2],
-                    "gx": gx,
-                    "gy": gy,
-                    "gz": gz,
-                    "a_vert": a_vert,
-                    "rx": msg["motion"]["r"][0],
-                    "ry": msg["motion"]["r"][1],
-                    "rz": msg["motion"]["r"][2],
-                }
-            )
+    def read_lines(self, lines, batch_size=100000, decoder="auto"):
+        """
+        Updates the class state with many lines from the raw data file at once.
+        Parsed rows are grouped per message type and added to the stream buffers in batches,
+        which is much faster than feeding every message to `update_with`.
 
-        if msg["type"] == "iPhone-location":
-            self.phone_location.append(
-                {
-                    "t": pd.Timestamp(msg["location"]["timestamp"], unit="s"),
-                    "lon": msg["location"]["coordinate"]["lon"],
-                    "lat": msg["location"]["coordinate"]["lat"],
-                    "lonlat_acc": msg["location"]["coordinate"]["acc"],
-                    "alt": msg["location"]["altitude"]["val"],
-                    "alt_acc": msg["location"]["altitude"]["acc"],
-                    "course": msg["location"]["course"]["val"],
-                    "course_acc": msg["location"]["course"]["acc"],
-                    "speed": msg["location"]["speed"]["val"],
-                    "speed_acc": msg["location"]["speed"]["acc"],
-                }
-            )
+        Parameters
+        ----------
+        lines : iterable
+            Iterable of raw JSON lines (str or bytes), for instance an open raw.jsonl file
+        batch_size : int
+            Optional maximum number of lines that is parsed before the rows are added to the buffers
+        decoder : str
+            Optional JSON decoder: 'json' (standard library), 'orjson' or 'simdjson'. The default 'auto'
+            uses orjson when it is installed and falls back to the standard library otherwise.
 
-        if msg["type"] == "RunScribe-speedcadence":
-            self.footpods_sc.append(
-                {
-                    "t": pd.Timestamp(msg["t"], unit="s"),
-                    "foot": msg["runscribe"]["foot"],
-                    "cadence": msg["rsc"]["cadence"],
-                    "speed": msg["rsc"]["speed"],
-                }
-            )
+        Returns
+        -------
+        RawReader
+            A reference to this reader, for chaining purposes
+        """
+        for _ in self._read_batches(lines, batch_size, decoder):
+            pass
 
-        if msg["type"] == "RunScribe-metrics":
-            self.footpods.append(
-                {
-                    "t": pd.Timestamp(msg["t"], unit="s"),
-                    "foot": msg["runscribe"]["foot"],
-                    "pronation": msg["metrics"]["pronation"],
-                    "braking": msg["metrics"]["braking"],
-                    "impact": msg["metrics"]["impact"],
-                    "contact_time": msg["metrics"]["contactTime"],
-                    "flight_ratio": msg["metrics"]["flightRatio"],
-                    "strike": msg["metrics"]["strikeType"],
-                    "power": msg["metrics"]["power"],
-                }
-            )
+        return self
 
-        if msg["type"] == "Spotify" and "playstate" in msg:
-
-            if "name" in msg["playstate"]:
-                split_track = msg["playstate"]["name"].split("-", 2)
-                msg["playstate"]["artist"] = split_track[0].strip()
-                msg["playstate"]["track"] = split_track[1].strip()
-
-            self.music.append(
-                {
-                    "t": pd.Timestamp(msg["t"], unit="s"),
-                    "track_uri": msg["playstate"]["uri"],
-                    "paused": msg["playstate"]["paused"],
-                    "artist": msg["playstate"]["artist"],
-                    "track": msg["playstate"]["track"],
-                    "context_uri": msg["playstate"]["contextUri"],
-                    "context": msg["playstate"]["contextTitle"],
-                    "position": msg["playstate"]["position"] / 1000,
-                    "repeat_mode": msg["playstate"]["repeatMode"]
-                    if "repeatMode" in msg
-                    else "off",
-                    "shuffle": msg["playstate"]["shuffle"]
-                    if "shuffle" in msg
-                    else False,
-                    "crossfade": msg["playstate"]["crossfadeState"]
-                    if "crossfadeState" in msg
-                    else False,
-                }
-            )
+    def iter_chunks(self, lines, chunk_size=100000, chunk_seconds=None, decoder="auto"):
+        """
+        Reads lines from the raw data file and yields the data in chunks, so long recordings can be
+        processed with bounded memory. After each chunk the buffers of the reader are emptied, so
+        the `get_*_df` methods only return data that has not yet been yielded.
 
-        return True
+        Parameters
+        ----------
+        lines : iterable
+            Iterable of raw JSON lines (str or bytes), for instance an open raw.jsonl file or `follow`
+        chunk_size : int
+            Optional maximum number of lines that is parsed per chunk
+        chunk_seconds : float
+            Optional maximum sensor time [s] spanned by the messages of a chunk
+        decoder : str
+            Optional JSON decoder, see `read_lines`
+
+        Yields
+        ------
+        dict(str, pandas.DataFrame)
+            The DataFrames of the read streams with the rows of this chunk, see the `get_*_df` methods
+        """
+        for _ in self._read_batches(lines, chunk_size, decoder, chunk_seconds):
+            if any(len(getattr(self, stream)) > 0 for stream in self.streams):
+                # the buffers are cleared right away, so the frames can be views on them
+                dfs = self._get_dfs(copy=False)
+                for stream in self.streams:
+                    getattr(self, stream).clear()
+                yield dfs
+
+    def _read_batches(self, lines, batch_size, decoder, batch_seconds=None):
+        loads = _json_decoder(decoder)
+        batches = {msg_type: [] for msg_type in self._parsers}
+        count = 0
+        batch_start = None
+
+        for line in lines:
+            # skip lines of streams that are not read by a cheap scan for their type value
+            if self._needles is not None and not any(
+                needle in line for needle in self._needles[isinstance(line, bytes)]
+            ):
+                continue
+            if not line.strip():
+                continue
+
+            msg = loads(line)
+            if "t" in msg:
+                t = msg["t"]
+                self.t_range = [t, t] if self.t_range == [] else [self.t_range[0], t]
+
+                if batch_seconds is not None:
+                    if batch_start is None:
+                        batch_start = t
+                    elif t - batch_start >= batch_seconds:
+                        self._flush(batches)
+                        yield
+                        count = 0
+                        batch_start = t
+
+            if msg["type"] in batches:
+                row = self._parsers[msg["type"]][0](msg)
+                if row is not None:
+                    batches[msg["type"]].append(row)
+
+            count += 1
+            if count == batch_size:
+                self._flush(batches)
+                yield
+                count = 0
+                batch_start = None
+
+        self._flush(batches)
+        yield
+
+    def read_file(self, path, cache_dir=None, **kwargs):
+        """
+        Updates the class state with all lines of a raw data file, see `read_lines`.
+
+        Parameters
+        ----------
+        path : str
+            Path to the raw.jsonl file
+        cache_dir : str
+            Optional directory in which the parsed streams are cached as Parquet files (requires pyarrow
+            or fastparquet). The cache entry of a file is keyed by its path, size, modification time and
+            the read streams. If present, the streams are loaded from the cache instead of parsing the file.
+        kwargs
+            Optional arguments passed to `read_lines`
+
+        Returns
+        -------
+        RawReader
+            A reference to this reader, for chaining purposes
+        """
+        if cache_dir is None:
+            with open(path, "rb") as fh:
+                return self.read_lines(fh, **kwargs)
+
+        entry = os.path.join(cache_dir, self._cache_key(path))
+        meta = read_cache_meta(entry)
+        if meta is not None:
+            return self._read_cache(entry, meta)
+
+        sizes = {stream: len(getattr(self, stream)) for stream in self.streams}
+        t_range = self.t_range
+        self.t_range = []
+
+        with open(path, "rb") as fh:
+            self.read_lines(fh, **kwargs)
+
+        self._write_cache(entry, sizes)
+        self._merge_t_range(t_range, self.t_range)
+
+        return self
+
+    def _cache_key(self, path):
+        stat = os.stat(path)
+        key = "{}:{}:{}:{}".format(
+            os.path.abspath(path),
+            stat.st_size,
+            stat.st_mtime_ns,
+            ",".join(self.streams),
+        )
+
+        return hashlib.sha1(key.encode()).hexdigest()
+
+    def _read_cache(self, entry, meta):
+        for stream in self.streams:
+            getattr(self, stream).extend_columns(
+                pd.read_parquet(os.path.join(entry, stream + ".parquet"))
+            )
+        self._merge_t_range(self.t_range, meta["t_range"])
+
+        return self
+
+    def _write_cache(self, entry, sizes):
+        write_cache_entry(
+            entry,
+            {
+                stream: getattr(self, stream).to_raw_frame(start=sizes[stream])
+                for stream in self.streams
+            },
+            {"streams": self.streams, "t_range": self.t_range},
+        )
+
+    def _merge_t_range(self, first, second):
+        if first == [] or second == []:
+            self.t_range = first if second == [] else second
+        else:
+            self.t_range = [first[0], second[1]]
+
+    def _to_frame(self, buffer, copy=True):
+        df = buffer.to_frame(compact=self.compact, copy=copy)
+        return compact_dtypes(df) if self.compact else df
+
+    def _get_dfs(self, copy=True):
+        return {
+            stream: self._to_frame(getattr(self, stream), copy=copy)
+            for stream in self.streams
+        }
+
+    def _flush(self, batches):
+        for msg_type, rows in batches.items():
+            self._parsers[msg_type][1].extend(rows)
+            rows.clear()
 
     def get_footpods_df(self):
         """
@@ -189,7 +828,7 @@ class RawReader:
                     Power of the step [W]
 
         """
-        return pd.DataFrame(self.footpods)
+        return self._to_frame(self.footpods)
 
     def get_footpods_sc_df(self):
         """
@@ -216,7 +855,7 @@ class RawReader:
                     Average speed of the foot [m/s] based on estimated user height (may not be set properly)
 
         """
-        return pd.DataFrame(self.footpods_sc)
+        return self._to_frame(self.footpods_sc)
 
     def get_phone_motion_df(self):
         """
@@ -265,7 +904,7 @@ class RawReader:
 
 
         """
-        return pd.DataFrame(self.phone_motion)
+        return self._to_frame(self.phone_motion)
 
     def get_phone_location_df(self):
         """
@@ -309,7 +948,7 @@ class RawReader:
                     Estimated accuracy of speed [m/s]
 
         """
-        return pd.DataFrame(self.phone_location)
+        return self._to_frame(self.phone_location)
 
     def get_phone_activity_df(self):
         """
@@ -334,7 +973,7 @@ class RawReader:
                 Name: step, dtype: float64
                     Number of steps taken since starting session
 
-                Name: cadence, dtype: int64
+                Name: cadence, dtype: float64
                     Step frequency [/min]
 
                 Name: floors_ascended, dtype: int64
@@ -344,7 +983,7 @@ class RawReader:
                     Number of floors descended since starting session
 
         """
-        return pd.DataFrame(self.phone_activity)
+        return self._to_frame(self.phone_activity)
 
     def get_music_df(self):
         """
@@ -391,7 +1030,7 @@ class RawReader:
                     State indicating whether crossfade is turned on
 
         """
-        return pd.DataFrame(self.music)
+        return self._to_frame(self.music)
 
     def get_timestamp_range(self):
         """
@@ -404,3 +1043,118 @@ class RawReader:
 
         """
         return self.t_range
+
+
+def follow(path, poll_interval=1.0, timeout=None):
+    """
+    Follow a raw data file that is being appended to, like `tail -f`, and yield its complete lines.
+    Use it as input of `RawReader.iter_chunks` to process a live recording.
+
+    Parameters
+    ----------
+    path : str
+        Path to the raw.jsonl file
+    poll_interval : float
+        Optional time [s] to wait before checking again for new data when the end of the file is reached
+    timeout : float
+        Optional time [s] without new data after which to stop, defaults to following forever
+
+    Yields
+    ------
+    bytes
+        Complete lines of the file, including the lines already present when starting
+    """
+    with open(path, "rb") as fh:
+        pending = b""
+        last_data = time.monotonic()
+
+        while True:
+            line = fh.readline()
+            if line:
+                last_data = time.monotonic()
+                pending += line
+                if pending.endswith(b"\n"):
+                    yield pending
+                    pending = b""
+            elif timeout is not None and time.monotonic() - last_data >= timeout:
+                break
+            else:
+                time.sleep(poll_interval)
+
+
+def _read_raw_file(path, streams=None, compact=False, **kwargs):
+    return (
+        RawReader(streams=streams, compact=compact)
+        .read_file(path, **kwargs)
+        ._get_dfs(copy=False)
+    )
+
+
+def read_raw_files(
+    paths,
+    keys=None,
+    source_column="source",
+    processes=None,
+    streams=None,
+    compact=False,
+    **kwargs
+):
+    """
+    Read many raw data files (raw.jsonl) in parallel, using one `RawReader` per file in a pool of processes.
+
+    Note: on platforms that spawn worker processes (Windows, macOS) call this function from within an
+    `if __name__ == "__main__":` block.
+
+    Parameters
+    ----------
+    paths : list
+        List of paths to the raw.jsonl files
+    keys : list
+        Optional list with the same length as paths with the source/session key of each file, defaults to the paths
+    source_column : str
+        Optional name of the column added to every DataFrame with the key of the file the row was read from
+    processes : int
+        Optional number of worker processes, defaults to the number of cores. If 1, files are read in this process.
+    streams : list
+        Optional names of the streams to read, see `RawReader`
+    compact : bool
+        Optional whether to return compact dtypes, see `RawReader`. The source column is then categorical too.
+    kwargs
+        Optional arguments passed to `RawReader.read_lines`, such as the decoder
+
+    Returns
+    -------
+    dict(str, pandas.DataFrame)
+        The concatenated and time-sorted DataFrames of all files, under the keys of the read streams
+        'footpods', 'footpods_sc', 'phone_activity', 'phone_motion', 'music' and 'phone_location'.
+        See the `get_*_df` methods of `RawReader` for their columns.
+    """
+    from functools import partial
+
+    keys = paths if keys is None else keys
+    read = partial(_read_raw_file, streams=streams, compact=compact, **kwargs)
+
+    if processes == 1:
+        results = map(read, paths)
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            results = list(executor.map(read, paths))
+
+    dfs_per_stream = {}
+    for key, result in zip(keys, results):
+        for stream, df in result.items():
+            df[source_column] = key
+            dfs_per_stream.setdefault(stream, []).append(df)
+
+    for stream, dfs in dfs_per_stream.items():
+        df = pd.concat(dfs, ignore_index=True)
+        df.sort_values(by="t", kind="mergesort", inplace=True)
+        df.reset_index(drop=True, inplace=True)
+        if compact:
+            # categories differ per file, so they fall back to object when concatenated
+            df = compact_dtypes(df, dict(COMPACT_DTYPES, **{source_column: "category"}))
+        dfs_per_stream[stream] = df
+
+    return dfs_per_stream
@@ -1,5 +1,6 @@
 """ High-level recipes for transforming raw data into statistics
 """
+import os
 import pandas as pd
 import numpy as np
 
@@ -9,6 +10,8 @@ from mergait.bouts import *
 from mergait.music import *
 from mergait.stats import *
 from mergait.imu import *
+from mergait.imustore import *
+from mergait.utility import *
 
 import logging
 
@@ -41,25 +44,33 @@ def filter_to_valid_bouts_recipe(
     pandas.DataFrame
         A DataFrame that now includes only valuable/valid data and a bout index per track/section
     """
-    df = df.copy()
-
-    # filter pod data on bouts
-    df = append_activity_filter(df, df_phone_activity)
-    df = append_elevation_filter(df, df_phone_activity)
+    # combine the activity and elevation filters on their bouts, and only apply the result to the steps
+    valid_bouts = get_activity_bouts(df_phone_activity).difference(
+        get_elevation_bouts(df_phone_activity)
+    )
+    valid_steps = valid_bouts.covers(df["t"])
 
-    # filter pod data with music playstate and merge playstate position
+    # filter pod data with music playstate and merge playstate position, keeping the positions of
+    # the steps so the run bouts below are split at every removed step
+    df = df[valid_steps].assign(bad_not_running=False, bad_not_flat=False)
+    columns = df.columns
     df = merge_music_playstate(df, df_music)
+    df.index = np.flatnonzero(valid_steps)
+    if len(df) == 0:
+        # merging an empty DataFrame moves the merge key, keep the column order of merging all steps
+        df = df[columns.append(df.columns.difference(columns, sort=False))]
 
     # extract valuable run bouts and add a bout index
-    valid = ~(
+    valid = pd.Series(False, index=pd.RangeIndex(len(valid_steps)))
+    valid[df.index] = ~(
         df["bad_not_running"]
         | df["bad_not_flat"]
         | df["bad_no_music"]
         | df["bad_half_step"]
-    )
+    ).values
 
     # actually filter the steps
-    df = df[valid]
+    df = df[valid[df.index]]
 
     # add session_id
     add_bouts_as_column(
@@ -80,8 +91,21 @@ def filter_to_valid_bouts_recipe(
     return df
 
 
+def _run_stage(cache, func, *args, **kwargs):
+    if cache is None:
+        return func(*args, **kwargs)
+
+    return cache(func, *args, **kwargs)
+
+
 def recipe_footpod_symmetry(
-    df_footpods, df_music, df_phone_activity, df_sessions, sections=None
+    df_footpods,
+    df_music,
+    df_phone_activity,
+    df_sessions,
+    sections=None,
+    method="sa",
+    cache=None,
 ):
     """
     Recipe for extracting statistical symmetry information per song for
@@ -100,6 +124,11 @@ def recipe_footpod_symmetry(
     sections : None or pandas.DataFrame
         If a DataFrame is given, use it to compute the footpod symmetry per music section
         otherwise treat the track as one section
+    method : str
+        Optional symmetry index method, see `append_symmetry_index`
+    cache : StageCache
+        Optional cache for the results of the stages of the recipe, so they are only computed again when
+        their input changes
 
     Returns
     -------
@@ -113,13 +142,19 @@ def recipe_footpod_symmetry(
     df_pods = df_footpods.copy()
 
     # combine pod data into pod_gait and annotate bad steps
-    df_pod_steps = merge_left_right_data(df_pods)
-
-    df_pod_steps = filter_to_valid_bouts_recipe(
-        df_pod_steps, df_music, df_phone_activity, df_sessions, sections=sections
+    df_pod_steps = _run_stage(cache, merge_left_right_data, df_pods)
+
+    df_pod_steps = _run_stage(
+        cache,
+        filter_to_valid_bouts_recipe,
+        df_pod_steps,
+        df_music,
+        df_phone_activity,
+        df_sessions,
+        sections=sections,
     )
 
-    df_pod_steps = append_symmetry_index(df_pod_steps, method="sa")
+    df_pod_steps = _run_stage(cache, append_symmetry_index, df_pod_steps, method=method)
 
     by_bouts = ["session_id", "track_uri"]
     if not sections is None:
@@ -128,11 +163,7 @@ def recipe_footpod_symmetry(
     log.debug("Computing aggregate statistics per song/section")
 
     # now convert to statistical summary per song/section
-    summary = df_pod_steps.groupby(by=by_bouts, sort=False).agg(
-        ["mean", "std", "median", iqr, rmse, mae]
-    )
-    summary.columns = summary.columns.map("_".join)
-    df_pod_symmetry = summary.reset_index()
+    df_pod_symmetry = _summarize_steps(df_pod_steps, by_bouts)
 
     log.debug(
         "] Done, computed symmetry for {} cycles in {} songs/sections".format(
@@ -143,8 +174,23 @@ def recipe_footpod_symmetry(
     return [df_pod_steps, df_pod_symmetry]
 
 
+def _summarize_steps(df, by_bouts):
+    summary = df.groupby(by=by_bouts, sort=False, observed=True).agg(
+        ["mean", "std", "median", iqr, rmse, mae]
+    )
+    summary.columns = summary.columns.map("_".join)
+
+    return summary.reset_index()
+
+
 def recipe_imu_symmetry(
-    df_imu, df_music, df_phone_activity, df_sessions, sections=None
+    df_imu,
+    df_music,
+    df_phone_activity,
+    df_sessions,
+    sections=None,
+    method="sa",
+    cache=None,
 ):
     """
     Recipe for extracting statistical symmetry information per song for
@@ -163,6 +209,11 @@ def recipe_imu_symmetry(
     sections : None or pandas.DataFrame
         If a DataFrame is given, use it to compute the footpod symmetry per music section
         otherwise treat the track as one section
+    method : str
+        Optional symmetry index method, see `append_symmetry_index`
+    cache : StageCache
+        Optional cache for the results of the stages of the recipe, so they are only computed again when
+        their input changes
 
     Returns
     -------
@@ -177,21 +228,31 @@ def recipe_imu_symmetry(
     df_acc = df_imu.copy()
     t_acc, a_vert = pd.to_numeric(df_acc["t"]), df_acc["a_vert"]
 
-    df_imu_steps, ic_times_ns, fc_times_ns = gait_features_from_vertical_acceleration(
-        t_acc, a_vert
+    df_imu_steps, ic_times_ns, fc_times_ns = _run_stage(
+        cache, gait_features_from_vertical_acceleration, t_acc, a_vert
     )
 
     # assign foot names (we don't know whether it is left or right) so we can compute symmetry
     df_imu_steps["foot"] = "A"
     df_imu_steps["foot"][1::2] = "B"
 
-    df_imu_steps = merge_left_right_data(df_imu_steps, feet=["A", "B"], side="both")
+    df_imu_steps = _run_stage(
+        cache, merge_left_right_data, df_imu_steps, feet=["A", "B"], side="both"
+    )
 
-    df_imu_steps = filter_to_valid_bouts_recipe(
-        df_imu_steps, df_music, df_phone_activity, df_sessions, sections=sections
+    df_bout_steps = _run_stage(
+        cache,
+        filter_to_valid_bouts_recipe,
+        df_imu_steps,
+        df_music,
+        df_phone_activity,
+        df_sessions,
+        sections=sections,
     )
 
-    df_imu_steps = append_symmetry_index(df_imu_steps, method="sa")
+    df_imu_steps = _run_stage(
+        cache, append_symmetry_index, df_bout_steps, method=method
+    )
 
     by_bouts = ["session_id", "track_uri"]
     if not sections is None:
@@ -200,23 +261,25 @@ def recipe_imu_symmetry(
     # now convert to statistical summary per song/section
     log.debug("Computing aggregate statistics per song/section")
 
-    summary = df_imu_steps.groupby(by=by_bouts, sort=False).agg(
-        ["mean", "std", "median", iqr, rmse, mae]
-    )
-    summary.columns = summary.columns.map("_".join)
-    df_imu_symmetry = summary.reset_index()
+    df_imu_symmetry = _summarize_steps(df_imu_steps, by_bouts)
 
-    # now also add gsi information
+    # now also add gsi information, which only depends on the bouts and not on the symmetry index
     if sections is None:
-        df_gsi_bouts = compute_gsi_from_imu_recipe(
-            df_imu_steps, df_imu, by=["track_uri", "session_id"]
+        df_gsi_bouts = _run_stage(
+            cache,
+            compute_gsi_from_imu_recipe,
+            df_bout_steps,
+            df_imu,
+            by=["track_uri", "session_id"],
         )
     else:
-        df_gsi_bouts = compute_gsi_from_imu_recipe(df_imu_steps, df_imu)
+        df_gsi_bouts = _run_stage(
+            cache, compute_gsi_from_imu_recipe, df_bout_steps, df_imu
+        )
 
     df_gsi_summary = (
         df_gsi_bouts.drop("bout_idx", axis=1)
-        .groupby(by=by_bouts, sort=False)
+        .groupby(by=by_bouts, sort=False, observed=True)
         .agg(["mean", "median"])
     )
     df_gsi_summary.columns = df_gsi_summary.columns.map("_".join)
@@ -233,7 +296,9 @@ def recipe_imu_symmetry(
     return [df_imu_steps, df_imu_symmetry]
 
 
-def compute_gsi_from_imu_recipe(df, df_imu, by=["track_uri", "session_id", "section"]):
+def compute_gsi_from_imu_recipe(
+    df, df_imu, by=["track_uri", "session_id", "section"], max_workers=None
+):
     """
     Recipe for computing the gait symmetric index (GSI) from bouts of imu data.
 
@@ -241,10 +306,12 @@ def compute_gsi_from_imu_recipe(df, df_imu, by=["track_uri", "session_id", "sect
     ----------
     df : pandas.DataFrame
         DataFrame bout information
-    df_imu : pandas.DataFrame
-        DataFrame containing the phone imu data
+    df_imu : pandas.DataFrame or IMUStore
+        DataFrame or memory-mapped store containing the phone imu data
     by : pandas.DataFrame
         Columns to group the data by
+    max_workers : int
+        Optional maximum number of bouts that is computed concurrently, 1 to compute them one by one
 
     Returns
     -------
@@ -261,17 +328,27 @@ def compute_gsi_from_imu_recipe(df, df_imu, by=["track_uri", "session_id", "sect
     # group by bout, to compute the gsi only for a continuous stretch of data
     df_gsi_bouts = df.groupby("bout_idx").agg(agg_funs).reset_index()
 
-    def apply_gsi(row):
-        df_acc = df_imu[(df_imu.t > row.t[0]) & (df_imu.t < row.t[1])]
-        gsi, stride_duration = gait_symmety_index_from_acceleration(
-            df_acc.ax, df_acc.ay, df_acc.az
-        )
-        return gsi, stride_duration * 1000, 2 * 60 / stride_duration
-
-    # perform the gsi computation per bout
-    df_gsi_bouts[["gsi", "stride_duration", "cadence"]] = df_gsi_bouts.apply(
-        apply_gsi, axis=1, result_type="expand"
+    if isinstance(df_imu, IMUStore):
+        t = df_imu.column("t")
+        acc = [df_imu.column(axis) for axis in ["ax", "ay", "az"]]
+    else:
+        if not df_imu.t.is_monotonic_increasing:
+            df_imu = df_imu.sort_values(by="t", kind="mergesort")
+        t = pd.to_numeric(df_imu.t).values
+        acc = [df_imu[axis].values for axis in ["ax", "ay", "az"]]
+
+    # locate the imu samples strictly within every bout by binary search
+    starts = np.searchsorted(t, pd.to_numeric(df_gsi_bouts["t"]["first"]), side="right")
+    ends = np.searchsorted(t, pd.to_numeric(df_gsi_bouts["t"]["last"]), side="left")
+    ends = np.maximum(starts, ends)
+
+    # perform the gsi computation for all bouts at once
+    gsi, stride_duration = gait_symmetry_index_per_range(
+        *acc, starts, ends, max_workers=max_workers
     )
+    df_gsi_bouts["gsi"] = gsi
+    df_gsi_bouts["stride_duration"] = stride_duration * 1000
+    df_gsi_bouts["cadence"] = 2 * 60 / stride_duration
 
     # clean up return DataFrame
     df_gsi_bouts.columns = [c[0] for c in df_gsi_bouts.columns]
@@ -279,3 +356,258 @@ def compute_gsi_from_imu_recipe(df, df_imu, by=["track_uri", "session_id", "sect
 
     log.debug("] Computed the gsi for {} bouts".format(len(df_gsi_bouts)))
     return df_gsi_bouts
+
+
+def recipe_per_session(
+    recipe,
+    df_data,
+    df_music,
+    df_phone_activity,
+    df_sessions,
+    sections=None,
+    processes=None,
+    margin=10,
+    cache_dir=None,
+    **kwargs
+):
+    """
+    Run a symmetry recipe (`recipe_footpod_symmetry` or `recipe_imu_symmetry`) for every session separately
+    in a pool of processes, and combine the results into those of all sessions.
+
+    Sessions are independent, so the data is partitioned by the session bouts and every worker only receives
+    the data of its session (plus a margin of context around it). An `IMUStore` is not copied to the workers
+    at all, every worker reads the time range of its session from the memory-mapped store. Note that the
+    arbitrary feet 'A' and 'B' of `recipe_imu_symmetry` are assigned per session.
+
+    The results equal those of running the recipe on all data at once, except for the numbering of the bouts.
+    A single run also numbers the bouts that are left without steps (e.g. a bout of a single step), so its
+    bout index can skip numbers that the consecutive numbering per session does not.
+
+    With a cache directory the run is incremental: the results of every session are stored together with a
+    fingerprint of its inputs (its data, session bout, the music and activity data around it, the sections and
+    the recipe), and only the sessions that are new or whose inputs changed are computed again.
+
+    Note: on platforms that spawn worker processes (Windows, macOS) call this function from within an
+    `if __name__ == "__main__":` block.
+
+    Parameters
+    ----------
+    recipe : function
+        The recipe to run per session, `recipe_footpod_symmetry` or `recipe_imu_symmetry`
+    df_data : pandas.DataFrame or IMUStore
+        DataFrame containing footpod data, or DataFrame or memory-mapped store containing the phone imu data
+    df_music : pandas.DataFrame
+        DataFrame containing music playstate data
+    df_phone_activity : pandas.DataFrame
+        DataFrame containing the phone activity monitor data
+    df_sessions : pandas.DataFrame
+        DataFrame containing the session bouts
+    sections : None or pandas.DataFrame
+        If a DataFrame is given, use it to compute the symmetry per music section
+        otherwise treat the track as one section
+    processes : int
+        Optional number of worker processes, defaults to the number of cores. If 1, sessions are run in this process.
+    margin : float
+        Optional time [s] of data before and after a session that is given to the recipe as context
+    cache_dir : str
+        Optional directory in which the results per session are stored as Parquet files (requires pyarrow
+        or fastparquet), to only compute the sessions that changed since the previous run
+    kwargs
+        Optional arguments passed to the recipe, such as the symmetry method or a `StageCache`
+
+    Returns
+    -------
+    pandas.DataFrame
+        The data of all valid gait cycle steps, in the order of the sessions. The bout index is unique and
+        increasing over all sessions, but not necessarily equal to that of a single run. Steps outside any
+        session are not included.
+    pandas.DataFrame
+        The summarized statistical symmetry data per song (or per section)
+    """
+    from functools import partial
+
+    log.debug("[ Running the recipe per session")
+
+    sessions = df_sessions.dropna(subset=["t_start", "t_end"]).sort_values(
+        by="t_start", kind="mergesort"
+    )
+    margin = pd.Timedelta(margin, "s")
+    windows = [
+        [t_start - margin, t_end + margin]
+        for t_start, t_end in zip(sessions["t_start"], sessions["t_end"])
+    ]
+
+    if isinstance(df_data, IMUStore):
+        partitions = [(df_data.path, t_start, t_end) for t_start, t_end in windows]
+        sizes = [
+            np.diff(df_data.slice_index(t_start, t_end, inclusive="both"))[0]
+            for t_start, t_end in windows
+        ]
+    else:
+        partitions = [selection[0] for selection in select_ranges(df_data, windows)]
+        sizes = [len(partition) for partition in partitions]
+
+    # every session only gets its own session bout, so the data in the margins is not assigned to any session
+    tasks = [
+        (partition, sessions.iloc[[i]])
+        for i, (partition, size) in enumerate(zip(partitions, sizes))
+        if size > 0
+    ]
+    if len(tasks) == 0:
+        raise ValueError("There is no data within the sessions")
+    run = partial(
+        _run_session_recipe,
+        recipe,
+        df_music=df_music,
+        df_phone_activity=df_phone_activity,
+        sections=sections,
+        **kwargs
+    )
+
+    # reuse the stored results of the sessions of which the inputs did not change
+    results = [None] * len(tasks)
+    if cache_dir is not None:
+        keys = _session_fingerprints(
+            recipe,
+            df_data,
+            tasks,
+            df_music,
+            df_phone_activity,
+            sections,
+            margin,
+            kwargs,
+        )
+        results = [
+            _read_session_cache(cache_dir, df_session, key)
+            for (_, df_session), key in zip(tasks, keys)
+        ]
+    todo = [i for i, result in enumerate(results) if result is None]
+    log.debug("Computing {} of {} sessions".format(len(todo), len(tasks)))
+
+    if processes == 1 or len(todo) < 2:
+        computed = [run(*tasks[i]) for i in todo]
+    else:
+        from concurrent.futures import ProcessPoolExecutor
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            computed = list(executor.map(run, *zip(*[tasks[i] for i in todo])))
+
+    for i, result in zip(todo, computed):
+        results[i] = result
+        if cache_dir is not None:
+            _write_session_cache(cache_dir, tasks[i][1], keys[i], result)
+
+    # number the bouts over all sessions, in the order of the sessions
+    offset = 0
+    for df_steps, _ in results:
+        if df_steps["bout_idx"].notna().any():
+            df_steps["bout_idx"] += offset
+            offset = df_steps["bout_idx"].max() + 1
+
+    df_steps = pd.concat([result[0] for result in results], ignore_index=True)
+
+    # columns that can not be summarized for some song are dropped, so only keep those of all sessions
+    summaries = [result[1] for result in results if len(result[1]) > 0]
+    df_symmetry = pd.concat(
+        summaries or [result[1] for result in results], join="inner", ignore_index=True
+    )
+
+    # the summary includes statistics of the bout index, so summarize the new bout index again
+    by_bouts = ["session_id", "track_uri"]
+    if not sections is None:
+        by_bouts.append("section")
+
+    if len(df_symmetry) > 0:
+        df_bouts = _summarize_steps(df_steps[by_bouts + ["bout_idx"]], by_bouts)
+        df_bouts = df_bouts.set_index(by_bouts).reindex(
+            pd.MultiIndex.from_frame(df_symmetry[by_bouts])
+        )
+        for column in df_bouts.columns:
+            df_symmetry[column] = df_bouts[column].values
+
+    log.debug("] Done, ran the recipe for {} sessions with data".format(len(results)))
+
+    return [df_steps, df_symmetry]
+
+
+def _run_session_recipe(
+    recipe, df_data, df_session, df_music, df_phone_activity, sections, **kwargs
+):
+    if isinstance(df_data, tuple):
+        path, t_start, t_end = df_data
+        df_data = IMUStore(path).to_frame(t_start, t_end, inclusive="both")
+
+    df_steps, df_symmetry = recipe(
+        df_data, df_music, df_phone_activity, df_session, sections=sections, **kwargs
+    )
+
+    session_id = df_session["session_id"].iloc[0]
+    df_steps = df_steps[df_steps["session_id"] == session_id]
+    df_symmetry = df_symmetry[df_symmetry["session_id"] == session_id]
+
+    return df_steps, df_symmetry
+
+
+def _session_fingerprints(
+    recipe, df_data, tasks, df_music, df_phone_activity, sections, margin, kwargs
+):
+    # the music and activity state at a time depends on the last row before it too
+    context = [
+        df.sort_values(by="t", kind="mergesort").reset_index(drop=True)
+        for df in [df_music, df_phone_activity]
+    ]
+
+    keys = []
+    for partition, df_session in tasks:
+        t_start = df_session["t_start"].iloc[0] - margin
+        t_end = df_session["t_end"].iloc[0] + margin
+
+        if isinstance(partition, tuple):
+            data = df_data.slice(t_start, t_end, inclusive="both")
+        else:
+            data = partition.reset_index(drop=True)
+
+        rows = []
+        for df in context:
+            start = max(df["t"].searchsorted(t_start, side="left") - 1, 0)
+            end = df["t"].searchsorted(t_end, side="right")
+            rows.append(df.iloc[start:end])
+
+        keys.append(
+            fingerprint(
+                recipe,
+                margin,
+                df_session.reset_index(drop=True),
+                data,
+                rows,
+                sections,
+                kwargs,
+            )
+        )
+
+    return keys
+
+
+def _session_cache_entry(cache_dir, df_session):
+    return os.path.join(cache_dir, fingerprint(str(df_session["session_id"].iloc[0])))
+
+
+def _read_session_cache(cache_dir, df_session, key):
+    entry = _session_cache_entry(cache_dir, df_session)
+    meta = read_cache_meta(entry)
+    if meta is None or meta["fingerprint"] != key:
+        return None
+
+    return [
+        pd.read_parquet(os.path.join(entry, name + ".parquet"))
+        for name in ["steps", "symmetry"]
+    ]
+
+
+def _write_session_cache(cache_dir, df_session, key, result):
+    write_cache_entry(
+        _session_cache_entry(cache_dir, df_session),
+        dict(zip(["steps", "symmetry"], result)),
+        {"session_id": str(df_session["session_id"].iloc[0]), "fingerprint": key},
+        replace=True,
+    )
@@ -64,7 +64,7 @@ def mae(values, cmp=0):
     return np.mean(np.abs(cmp - values))
 
 
-def autocorrelate(data, unbiased=True):
+def autocorrelate(data, unbiased=True, maxlag=None, method='auto'):
     '''
     Compute the autocorrelation for given data.
 
@@ -75,21 +75,50 @@ def autocorrelate(data, unbiased=True):
     unbiased : bool
         Whether the biased or unbiased autocorrelation should be computed.
         The biased version tapers off with lag, while the unbiased version does not.
+    maxlag : int
+        Optional number of lags to compute (starting at lag 0), defaults to all lags
+    method : str
+        Optional 'direct' to compute each lag as a dot product in O(N*maxlag), which gives exactly the values
+        of `numpy.correlate`, 'fft' to compute all lags in O(N log N), or 'auto' to choose the fastest one
 
     Returns
     -------
     list
         List of autocorrelation values with 0 and positive lags
     '''
-    import numpy as np
-
-    autocorrelation = np.correlate(data, data, 'full')
-    N = autocorrelation.size
+    data = np.asarray(data)
+    if data.dtype.kind != 'f':
+        data = data.astype(np.float64)
+
+    N = data.size
+    maxlag = N if maxlag is None else min(maxlag, N)
+    nfft = 1 << (2 * N - 2).bit_length()
+
+    if method == 'auto':
+        # rough cost of both methods, including the overhead of a dot product per lag
+        direct_cost = maxlag * (N + 4000)
+        fft_cost = 14 * nfft * np.log2(nfft)
+        method = 'direct' if direct_cost < fft_cost else 'fft'
+
+    if method == 'direct' and N * N <= maxlag * (N + 4000):
+        # short data, all lags at once is cheaper than a dot product per lag
+        autocorrelation = np.correlate(data, data, 'full')[N - 1:N - 1 + maxlag]
+    elif method == 'direct':
+        # lag 0 as computed by numpy.correlate, as it differs in rounding from a dot product for short data
+        autocorrelation = np.array([np.correlate(data, data)[0]] +
+                                   [np.dot(data[lag:], data[:N - lag]) for lag in range(1, maxlag)],
+                                   dtype=data.dtype)
+    elif method == 'fft':
+        spectrum = np.fft.rfft(data, nfft)
+        power = spectrum.real**2 + spectrum.imag**2
+        autocorrelation = np.fft.irfft(power, nfft)[:maxlag].astype(data.dtype)
+    else:
+        raise ValueError("Unknown autocorrelation method '{}'".format(method))
 
     if (unbiased):
-        autocorrelation /= (N - np.arange(N))
+        autocorrelation /= (N - np.arange(maxlag))
 
-    # normalize and cut to lagged correlation coefficients
-    autocorrelation_lags = autocorrelation[N // 2:] / autocorrelation[N // 2]
+    # normalize to lagged correlation coefficients
+    autocorrelation_lags = autocorrelation / autocorrelation[0]
 
     return autocorrelation_lags
@@ -2,13 +2,128 @@
 General utility functions for handling the data
 """
 
+import functools
+import inspect
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
 import pandas as pd
 
+# dtypes of the columns in compact mode, see the codebook
+COMPACT_DTYPES = {
+    # repeated strings
+    "foot": "category",
+    "activity": "category",
+    "track_uri": "category",
+    "artist": "category",
+    "track": "category",
+    "context_uri": "category",
+    "context": "category",
+    "repeat_mode": "category",
+    "session_id": "category",
+    # sensor channels
+    "ax": "float32",
+    "ay": "float32",
+    "az": "float32",
+    "gx": "float32",
+    "gy": "float32",
+    "gz": "float32",
+    "a_vert": "float32",
+    "rx": "float32",
+    "ry": "float32",
+    "rz": "float32",
+    "pronation": "float32",
+    "braking": "float32",
+    "impact": "float32",
+    "flight_ratio": "float32",
+    "speed": "float32",
+    # small integers
+    "strike": "int8",
+    "power": "int16",
+    "cadence": "int16",
+    "contact_time": "int16",
+    "floors_ascended": "int16",
+    "floors_descended": "int16",
+}
 
-def load_datadumps(paths, timestamp_columns=["t"], file_type="csv", base_path=""):
+
+def compact_dtypes(df, dtypes=COMPACT_DTYPES):
+    """
+    Convert the columns of a DataFrame to compact dtypes: categoricals for repeated strings, float32 for
+    sensor channels and small integers for per-step values such as strike, power and cadence.
+    Integer dtypes are only applied to integer columns whose values fit, other columns are left as is.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The DataFrame to convert
+    dtypes : dict
+        Optional mapping of column name to compact dtype, defaults to `COMPACT_DTYPES`
+
+    Returns
+    -------
+    pandas.DataFrame
+        A new DataFrame with compact dtypes
+    """
+    compact = {}
+    for column, dtype in dtypes.items():
+        if column not in df or df[column].dtype == dtype:
+            continue
+
+        if dtype in ["int8", "int16", "int32"]:
+            values = df[column]
+            info = np.iinfo(dtype)
+            if not (
+                pd.api.types.is_integer_dtype(values)
+                and (
+                    len(values) == 0
+                    or info.min <= values.min() <= values.max() <= info.max
+                )
+            ):
+                continue
+
+        compact[column] = dtype
+
+    return df.astype(compact)
+
+
+def _read_datadump(path, timestamp_columns, compact, read_kwargs):
+    df = pd.read_csv(path, **read_kwargs)
+
+    # the dumps are usually already time-ordered, which is much cheaper to check than to sort
+    timestamp_columns = [column for column in timestamp_columns if column in df]
+    if (
+        len(timestamp_columns) > 0
+        and not df[timestamp_columns[0]].is_monotonic_increasing
+    ):
+        df.sort_values(by=timestamp_columns[0], inplace=True)
+    df.reset_index(drop=True, inplace=True)
+
+    return compact_dtypes(df) if compact else df
+
+
+def _iter_datadump(path, compact, read_kwargs):
+    with pd.read_csv(path, **read_kwargs) as reader:
+        for df in reader:
+            yield compact_dtypes(df) if compact else df
+
+
+def load_datadumps(
+    paths,
+    timestamp_columns=["t"],
+    file_type="csv",
+    base_path="",
+    compact=False,
+    columns=None,
+    dtype=None,
+    chunksize=None,
+    max_workers=None,
+):
     """
     Load one or more datadump files into Pandas DataFrames.
-    It additionally parses date columns and sorts by timestamp.
+    It additionally parses date columns and sorts by timestamp, unless the data is already sorted.
 
     Parameters
     ----------
@@ -20,19 +135,366 @@ def load_datadumps(paths, timestamp_columns=["t"], file_type="csv", base_path=""
         Optional type of the datadump file, defaults to csv
     base_path : str
         Optional path to append to all filename paths given in the first argument
+    compact : bool
+        Optional whether to return compact dtypes, see `compact_dtypes`
+    columns : list
+        Optional list of the columns to load, defaults to all columns
+    dtype : dict
+        Optional mapping of column name to dtype, used while parsing the file
+    chunksize : int
+        Optional number of rows per chunk. If given, an iterator of DataFrames is returned per path instead
+        of a single DataFrame, to process files larger than memory. Chunks are returned in file order, not sorted.
+    max_workers : int
+        Optional maximum number of files that is loaded concurrently, defaults to one thread per core (plus four)
 
     Returns
     -------
     list(pandas.DataFrame)
-        A list of DataFrames corresponding to the given paths
+        A list of DataFrames (or iterators of DataFrames) corresponding to the given paths
+    """
+    read_kwargs = {
+        "usecols": columns,
+        "parse_dates": [
+            column
+            for column in timestamp_columns
+            if columns is None or column in columns
+        ],
+        "dtype": dtype,
+    }
+    if compact:
+        # parse repeated strings and sensor channels straight into their compact dtype
+        read_kwargs["dtype"] = dict(
+            {
+                column: compact_dtype
+                for column, compact_dtype in COMPACT_DTYPES.items()
+                if not compact_dtype.startswith("int")
+                and (columns is None or column in columns)
+            },
+            **(dtype or {})
+        )
+
+    paths_list = [
+        base_path + path for path in (paths if isinstance(paths, list) else [paths])
+    ]
+
+    if chunksize is not None:
+        dfs = [
+            _iter_datadump(path, compact, dict(read_kwargs, chunksize=chunksize))
+            for path in paths_list
+        ]
+    elif len(paths_list) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            dfs = list(
+                executor.map(
+                    lambda path: _read_datadump(
+                        path, timestamp_columns, compact, read_kwargs
+                    ),
+                    paths_list,
+                )
+            )
+    else:
+        dfs = [
+            _read_datadump(path, timestamp_columns, compact, read_kwargs)
+            for path in paths_list
+        ]
+
+    return dfs if isinstance(paths, list) else dfs[0]
+
+
+def write_cache_entry(path, frames, meta, replace=False):
+    """
+    Store DataFrames as Parquet files (requires pyarrow or fastparquet) together with their metadata as an
+    entry of an on-disk cache. The entry is written into a temporary directory first and then moved into
+    place, so readers never see a partially written entry.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the entry, inside the directory of the cache
+    frames : dict(str, pandas.DataFrame)
+        The DataFrames to store, by file name without extension
+    meta : dict
+        The metadata of the entry, stored as meta.json, see `read_cache_meta`
+    replace : bool
+        Optional whether to replace an existing entry, by default an existing entry is kept
+
+    Returns
+    -------
+    bool
+        Whether the entry was stored
+    """
+    cache_dir = os.path.dirname(path)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    tmp = tempfile.mkdtemp(dir=cache_dir)
+    try:
+        for name, df in frames.items():
+            df.to_parquet(os.path.join(tmp, name + ".parquet"))
+        with open(os.path.join(tmp, "meta.json"), "w") as fh:
+            json.dump(meta, fh)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+    if replace:
+        shutil.rmtree(path, ignore_errors=True)
+    try:
+        os.rename(tmp, path)
+    except OSError:
+        # another process stored the same entry in the meantime
+        shutil.rmtree(tmp, ignore_errors=True)
+        return False
+
+    return True
+
+
+def read_cache_meta(path):
+    """
+    Read the metadata of a cache entry, see `write_cache_entry`. The DataFrames of the entry are stored
+    as <name>.parquet in its directory.
+
+    Parameters
+    ----------
+    path : str
+        The directory of the entry
+
+    Returns
+    -------
+    dict
+        The metadata of the entry, or None if there is no such entry
+    """
+    try:
+        with open(os.path.join(path, "meta.json"), "r") as fh:
+            return json.load(fh)
+    except (FileNotFoundError, NotADirectoryError):
+        return None
+
+
+def fingerprint(*objects):
+    """
+    Compute a hash of the content of DataFrames, arrays and plain values, for instance to detect whether
+    the inputs of a computation changed since its result was stored.
+
+    Parameters
+    ----------
+    objects
+        DataFrames, Series, NumPy arrays, functions and plain values, or lists, tuples and dicts of them.
+        Functions are identified by their module and name, so lambdas and functions defined inside another
+        function are not supported
+
+    Returns
+    -------
+    str
+        The hexadecimal hash, equal for objects with equal content
+    """
+    import hashlib
+
+    hasher = hashlib.sha1()
+    for obj in objects:
+        _update_fingerprint(hasher, obj)
+
+    return hasher.hexdigest()
+
+
+def _update_fingerprint(hasher, obj):
+    if isinstance(obj, (pd.DataFrame, pd.Series)):
+        columns = (
+            list(obj.dtypes.items()) if isinstance(obj, pd.DataFrame) else obj.dtype
+        )
+        hasher.update(repr((type(obj).__name__, len(obj), str(columns))).encode())
+        hasher.update(pd.util.hash_pandas_object(obj).values.tobytes())
+    elif isinstance(obj, np.ndarray):
+        hasher.update(repr(("ndarray", obj.dtype.str, obj.shape)).encode())
+        hasher.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        hasher.update(repr(("dict", len(obj))).encode())
+        for key in sorted(obj, key=repr):
+            _update_fingerprint(hasher, key)
+            _update_fingerprint(hasher, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(repr((type(obj).__name__, len(obj))).encode())
+        for item in obj:
+            _update_fingerprint(hasher, item)
+    elif isinstance(obj, functools.partial):
+        hasher.update(b"partial")
+        _update_fingerprint(hasher, [obj.func, obj.args, obj.keywords])
+    elif inspect.ismethod(obj):
+        hasher.update(b"method")
+        _update_fingerprint(hasher, [obj.__func__, obj.__self__])
+    elif callable(obj) and hasattr(obj, "__qualname__"):
+        # the name does not identify a lambda or a nested function (closure), they may share it with others
+        if "<lambda>" in obj.__qualname__ or "<locals>" in obj.__qualname__:
+            raise ValueError(
+                "Can not fingerprint function '{}', only module-level functions are supported".format(
+                    obj.__qualname__
+                )
+            )
+        hasher.update(repr(("function", obj.__module__, obj.__qualname__)).encode())
+    else:
+        hasher.update(repr((type(obj).__name__, obj)).encode())
+
+
+class StageCache:
+    """
+    Opt-in, on-disk memoization of the expensive steps of a pipeline, such as the stages of the recipes.
+
+    A stage is called through the cache, which stores its result as Parquet files (requires pyarrow or
+    fastparquet) under a fingerprint of the function and the content of its arguments. Calling a stage again
+    with the same input returns the stored result, so when only a downstream parameter changes the upstream
+    stages are not computed again. The least recently used results are removed when the cache grows beyond
+    its maximum size.
+
+    The stages must be pure functions returning a DataFrame or Series, or a tuple or list of them. A stage is
+    called without caching its result when the result can not be stored as Parquet, when the stage is a lambda
+    or nested function that can not be identified by its name (see `fingerprint`), or when an argument can not
+    be hashed, such as a column of lists. Stored results are not invalidated when the code of a stage changes,
+    `clear` the cache after updating it.
+
+    Call a stage as `cache(merge_left_right_data, df_footpods)` instead of `merge_left_right_data(df_footpods)`,
+    or pass the cache to a recipe.
+
+    Parameters
+    ----------
+    path : str
+        The directory to store the results in
+    max_size : float
+        Optional maximum size of the stored results [bytes]
     """
-    dfs = []
 
-    for path in paths if isinstance(paths, list) else [paths]:
-        df = pd.read_csv(base_path + path, parse_dates=timestamp_columns)
-        if len(timestamp_columns) > 0:
-            df.sort_values(by=timestamp_columns[0], inplace=True)
-        df.reset_index(drop=True, inplace=True)
-        dfs.append(df)
+    def __init__(self, path, max_size=1e9):
+        self.path = path
+        self.max_size = max_size
+
+    def __repr__(self):
+        return "StageCache({!r})".format(self.path)
+
+    def __call__(self, func, *args, **kwargs):
+        """
+        Get the result of a stage, computing and storing it if it is not in the cache.
+
+        Parameters
+        ----------
+        func : function
+            The stage to call
+        args, kwargs
+            The arguments to call the stage with
+
+        Returns
+        -------
+        object
+            The (stored) result of func(*args, **kwargs)
+        """
+        try:
+            entry = os.path.join(self.path, fingerprint(func, args, kwargs))
+        except (ValueError, TypeError):
+            # e.g. a lambda, or unhashable values such as lists in a column
+            return func(*args, **kwargs)
+
+        result = self._read(entry)
+        if result is None:
+            result = func(*args, **kwargs)
+            self._write(entry, result)
+
+        return result
+
+    def size(self):
+        """
+        Get the size of the stored results.
+
+        Returns
+        -------
+        int
+            The total size of the stored results [bytes]
+        """
+        return sum(size for _, _, size in self._entries())
+
+    def clear(self):
+        """
+        Remove all stored results.
+        """
+        for entry, _, _ in self._entries():
+            shutil.rmtree(entry, ignore_errors=True)
+
+    def _entries(self):
+        if not os.path.isdir(self.path):
+            return []
+
+        entries = []
+        for entry in os.scandir(self.path):
+            meta = os.path.join(entry.path, "meta.json")
+            if entry.is_dir() and os.path.exists(meta):
+                size = sum(item.stat().st_size for item in os.scandir(entry.path))
+                entries.append((entry.path, os.stat(meta).st_mtime_ns, size))
+
+        return entries
+
+    def _read(self, entry):
+        meta = read_cache_meta(entry)
+        if meta is None:
+            return None
+
+        parts = meta["parts"]
+        try:
+            result = [
+                pd.read_parquet(os.path.join(entry, "{}.parquet".format(i)))
+                for i in range(len(parts))
+            ]
+        except FileNotFoundError:
+            # removed by another process in the meantime
+            return None
+
+        # mark the entry as recently used
+        os.utime(os.path.join(entry, "meta.json"))
+
+        for i, part in enumerate(parts):
+            if part["type"] == "Series":
+                result[i] = result[i].iloc[:, 0].rename(part["name"])
+        if "many" not in parts[0]:
+            return result[0]
+
+        return tuple(result) if parts[0]["many"] == "tuple" else result
+
+    def _write(self, entry, result):
+        many = isinstance(result, (tuple, list))
+        parts = list(result) if many else [result]
+        if len(parts) == 0 or not all(
+            isinstance(part, (pd.DataFrame, pd.Series)) for part in parts
+        ):
+            return
+        if any(
+            isinstance(part, pd.Series)
+            and part.name is not None
+            and not isinstance(part.name, str)
+            for part in parts
+        ):
+            return
+
+        frames = {}
+        meta = []
+        for i, part in enumerate(parts):
+            meta.append({"type": type(part).__name__})
+            if isinstance(part, pd.Series):
+                meta[i]["name"] = part.name
+                part = part.to_frame(name="values")
+            frames[str(i)] = part
+        if many:
+            meta[0]["many"] = type(result).__name__
+
+        try:
+            write_cache_entry(entry, frames, {"parts": meta})
+        except (ValueError, TypeError, NotImplementedError):
+            # e.g. non-string column names or mixed types
+            return
+
+        self._evict()
 
-    return dfs if isinstance(paths, list) else dfs[0]
\ No newline at end of file
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        size = sum(entry[2] for entry in entries)
+        for entry, _, entry_size in entries:
+            if size <= self.max_size:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            size -= entry_size